@@ -0,0 +1,226 @@
+#!/usr/local/bin/python3
+#
+# Command line analysis
+#
+# Answers questions about single positions for scripts. It never imports
+# pygame or the GUI modules, and each command imports only what it needs, so
+# it's ready in a few tens of milliseconds and most of a call's time is
+# spent on the question itself.
+#
+# Positions are given in FEN as in pdn.py ("B:W21,22,...:B1,2,...", where B
+# means black, Player.TWO, is to move), or "start". Moves are in PDN.
+#
+#   python3 analyze.py bestmove start --time 0.5                  print the best move
+#   python3 analyze.py analyze "W:W18,K3:B14,10" --depth 12       best move, score, depth and line
+#   python3 analyze.py perft start --depth 8 --divide             count the positions N plies on
+#   python3 analyze.py validate "B:W21,22:B9,10" 9-13 22-18       check a position and moves, print the FEN after them
+#
+# Add --json for JSON output and --timing to have the startup time written to stderr.
+#
+
+import time
+startTime = time.perf_counter()
+# CPU time the interpreter used starting up, before this file ran
+startupCpuTime = time.process_time()
+
+import sys
+import argparse
+from rules import *
+from pdn import PdnError, parseFen, formatFen, formatMove, parseMove
+
+# Raised for a position or move the command can't use. Its message is printed.
+class AnalysisError(Exception):
+    pass
+
+# The position for a FEN (or "start")
+def readPosition(text):
+    if text == "start":
+        return startingPosition()
+    try:
+        return parseFen(text)
+    except PdnError as error:
+        raise AnalysisError(str(error))
+
+# The problems with a position that can't come up in a game, if any
+def getPositionProblems(position):
+    problems = []
+    for name, pieces, backRow in (("white", position.white, ROWS[7]), ("black", position.yellow, ROWS[0])):
+        if popCount(pieces) > 12:
+            problems.append("%s has %d pieces" % (name, popCount(pieces)))
+        if pieces & ~position.kings & backRow:
+            problems.append("%s has an uncrowned man on the crowning row" % name)
+    if position.kings & ~(position.white | position.yellow):
+        problems.append("a king is marked on an empty square")
+    return problems
+
+# The line the engine expects, read from its transposition table
+def getPrincipalVariation(engine, position, maxLength):
+    from engine import getHash
+    line = []
+    seen = set()
+    while len(line) < maxLength and position not in seen:
+        seen.add(position)
+        entry = engine.table.probe(getHash(position))
+        moves = cachedLegalMoves(position)
+        if entry is None or entry[4] is None or entry[4] >= len(moves):
+            break
+        line.append(moves[entry[4]])
+        position = applyMove(position, moves[entry[4]])
+    return line
+
+def search(args, position):
+    from engine import Engine
+    book = None
+    if args.book is not None:
+        from openingBook import OpeningBook
+        book = OpeningBook(args.book)
+    engine = Engine(args.time, args.depth, args.table, book=book)
+    move = engine.search(position)
+    return (engine, move)
+
+#
+# Commands
+#
+# Each takes the parsed arguments and the position and returns a dict of
+# results, which is printed as JSON or as "key: value" lines.
+#
+
+# The engine plays a forced move without searching, so follow forced moves to
+# the first position with a choice and search that instead. Returns the
+# engine, the forced moves and the position after them.
+def searchPastForcedMoves(args, position):
+    from engine import Engine
+    forced = []
+    moves = cachedLegalMoves(position)
+    while len(moves) == 1:
+        forced.append(moves[0])
+        position = applyMove(position, moves[0])
+        moves = cachedLegalMoves(position)
+    engine = None
+    if moves:
+        engine = Engine(args.time, args.depth, args.table)
+        engine.search(position)
+    return (engine, forced, position)
+
+def analyzeCommand(args, position):
+    from engine import WIN
+    if not legalMoves(position):
+        return {"bestmove": None, "result": "loss", "fen": formatFen(position)}
+    if len(legalMoves(position)) == 1:
+        engine, line, endPosition = searchPastForcedMoves(args, position)
+        plies = len(line)
+        if engine is None:
+            # The forced moves end the game: the side left without a move loses
+            score = WIN - plies if plies % 2 else -(WIN - plies)
+            return {"bestmove": formatMove(line[0]), "score": score, "depth": plies, "nodes": 0,
+                    "seconds": 0.0, "nodesPerSecond": 0, "forced": True, "pv": " ".join(formatMove(pvMove) for pvMove in line)}
+        score = engine.score if plies % 2 == 0 else -engine.score
+        # Wins are scored by how far away they are
+        if score > WIN - 1000: score -= plies
+        elif score < -WIN + 1000: score += plies
+        line = line + getPrincipalVariation(engine, endPosition, max(engine.depth, 1))
+        move = line[0]
+        depth = engine.depth + plies
+    else:
+        engine, move = search(args, position)
+        if engine.depth == 0:
+            # A book move, played without searching
+            return {"bestmove": formatMove(move), "score": None, "depth": 0, "nodes": 0,
+                    "seconds": round(engine.elapsed, 4), "nodesPerSecond": 0, "book": True, "pv": formatMove(move)}
+        line = getPrincipalVariation(engine, position, max(engine.depth, 1))
+        if not line or line[0] != move:
+            line = [move]
+        score = engine.score
+        depth = engine.depth
+    return {"bestmove": formatMove(move), "score": score, "depth": depth, "nodes": engine.nodes,
+            "seconds": round(engine.elapsed, 4), "nodesPerSecond": int(engine.nodes / engine.elapsed) if engine.elapsed > 0 else 0,
+            "forced": len(legalMoves(position)) == 1, "pv": " ".join(formatMove(pvMove) for pvMove in line)}
+
+def bestMoveCommand(args, position):
+    engine, move = search(args, position)
+    return {"bestmove": formatMove(move) if move is not None else None}
+
+def perftCommand(args, position):
+    from perft import perft, divide
+    startTime = time.perf_counter()
+    results = {}
+    if args.divide:
+        counts = divide(position, args.depth)
+        results["divide"] = dict((formatMove(move), count) for move, count in counts)
+        nodes = sum(count for move, count in counts)
+    else:
+        nodes = perft(position, args.depth)
+    elapsed = time.perf_counter() - startTime
+    results.update({"depth": args.depth, "nodes": nodes, "seconds": round(elapsed, 4)})
+    return results
+
+def validateCommand(args, position):
+    problems = getPositionProblems(position)
+    if problems:
+        raise AnalysisError("invalid position: " + "; ".join(problems))
+    for number, text in enumerate(args.moves):
+        try:
+            position = applyMove(position, parseMove(position, text))
+        except PdnError as error:
+            raise AnalysisError("move %d: %s" % (number + 1, error))
+    winner = result(position)
+    return {"valid": True, "fen": formatFen(position), "legalMoves": " ".join(formatMove(move) for move in legalMoves(position)),
+            "result": None if winner is None else ("white wins" if winner is Player.ONE else "black wins")}
+
+COMMANDS = {"analyze": analyzeCommand, "bestmove": bestMoveCommand, "perft": perftCommand, "validate": validateCommand}
+
+def printResults(results, asJson):
+    if asJson:
+        import json
+        print(json.dumps(results))
+    elif list(results) == ["bestmove"]:
+        print(results["bestmove"] if results["bestmove"] is not None else "none")
+    else:
+        for key, value in results.items():
+            if isinstance(value, dict):
+                for subKey, subValue in value.items():
+                    print("%s: %s" % (subKey, subValue))
+            else:
+                print("%s: %s" % (key, value))
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(description="Analyse checkers positions from the command line.")
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument("position", help='FEN of the position, or "start"')
+    options.add_argument("--json", action="store_true", help="print the results as JSON")
+    options.add_argument("--timing", action="store_true", help="write the startup and command times to stderr")
+    searchOptions = argparse.ArgumentParser(add_help=False)
+    searchOptions.add_argument("--time", type=float, default=1.0, help="seconds to search for (default: 1)")
+    searchOptions.add_argument("--depth", type=int, default=64, help="maximum search depth (default: 64)")
+    searchOptions.add_argument("--table", type=int, default=32, help="transposition table megabytes (default: 32)")
+    searchOptions.add_argument("--book", help="opening book to play from (see openingBook.py)")
+
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("analyze", parents=[options, searchOptions], help="search a position and show the best move, score and line")
+    subcommands.add_parser("bestmove", parents=[options, searchOptions], help="print only the best move")
+    perftParser = subcommands.add_parser("perft", parents=[options], help="count the positions reachable in N plies")
+    perftParser.add_argument("--depth", type=int, default=6, help="plies (default: 6)")
+    perftParser.add_argument("--divide", action="store_true", help="count separately for each first move")
+    validateParser = subcommands.add_parser("validate", parents=[options], help="check a position, and moves played from it")
+    validateParser.add_argument("moves", nargs="*", help="moves to play from the position, in PDN")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parseArguments(argv)
+    importTime = time.perf_counter()
+    status = 0
+    try:
+        position = readPosition(args.position)
+        printResults(COMMANDS[args.command](args, position), args.json)
+    except AnalysisError as error:
+        print("error: %s" % error, file=sys.stderr)
+        status = 1
+    if args.timing:
+        sys.stdout.flush()
+        print("startup %.1f ms (interpreter %.1f ms CPU, imports and arguments %.1f ms), command %.1f ms" %
+              (startupCpuTime * 1000.0 + (importTime - startTime) * 1000.0, startupCpuTime * 1000.0,
+               (importTime - startTime) * 1000.0, (time.perf_counter() - importTime) * 1000.0), file=sys.stderr)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+import time
+import threading
+import multiprocessing
+from collections import namedtuple
+from rules import *
+
+#
+# Background search
+#
+# Runs the computer's searches in a separate process, so the game loop keeps
+# drawing while the computer thinks. (A thread wouldn't do: the search is
+# Python, so it would hold the interpreter lock the drawing needs.)
+#
+# Every request has a number. Starting a new request, or cancelling, changes
+# the current number in shared memory, and the search process checks it as it
+# searches, so an abandoned search stops within a few hundred nodes. Results
+# of abandoned requests are thrown away.
+#
+# While the person is thinking about their move, the computer ponders: it
+# searches the position after the reply it expects from them. If they play
+# it, the search already running becomes the real one and is given the time
+# for a move, otherwise it's abandoned (but has filled the transposition table).
+#
+
+SearchResult = namedtuple("SearchResult", ["request", "position", "move", "reply", "nodes", "depth", "score", "elapsed"])
+
+# Deadline of a ponder search, which runs until it's used or abandoned
+NO_DEADLINE = 1e18
+
+# Body of the search process. Searches each (request, position, pondering)
+# it's sent, unless it has been abandoned already, until it's sent None.
+def runSearcher(connection, currentRequest, deadline, timeLimit, workers, bookPath):
+    from engine import Engine, getHash
+    if workers > 1:
+        from parallelSearch import ParallelEngine
+        engine = ParallelEngine(timeLimit, workers=workers)
+    else:
+        engine = Engine(timeLimit)
+    if bookPath is not None:
+        from openingBook import OpeningBook
+        engine.book = OpeningBook(bookPath)
+
+    # The engine stops when its request is abandoned or the shared deadline passes
+    # (which moves when a ponder search becomes the real one)
+    request = 0
+    def isOutOfTime():
+        return currentRequest.value != request or time.time() > deadline.value
+    engine.isOutOfTime = isOutOfTime
+
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        request, position, pondering = message
+        if currentRequest.value != request:
+            continue
+
+        engine.timeLimit = NO_DEADLINE if pondering else timeLimit
+        move = engine.search(position)
+
+        # The reply the search expects, from the transposition table
+        reply = None
+        if move is not None:
+            newPosition = applyMove(position, move)
+            entry = engine.table.probe(getHash(newPosition))
+            moves = cachedLegalMoves(newPosition)
+            if entry is not None and entry[4] is not None and entry[4] < len(moves):
+                reply = moves[entry[4]]
+        connection.send(SearchResult(request, position, move, reply, engine.nodes, engine.depth, engine.score, engine.elapsed))
+    engine.close()
+
+#
+# BackgroundSearch Class
+#
+# Searches in a separate process, playing moves from the opening book at
+# bookPath (see openingBook.py) if there is one. onResult is called with the SearchResult of
+# each search that finishes without being abandoned. It is called from a
+# background thread (or from search() after a ponder hit), so it should only
+# hand the result over, e.g. with pygame.event.post.
+#
+class BackgroundSearch(object):
+    def __init__(self, timeLimit=1.0, workers=1, onResult=None, bookPath=None):
+        self.timeLimit = timeLimit
+        self.onResult = onResult
+        self.nextRequest = 1
+
+        # The position being pondered, while pondering
+        self.ponderPosition = None
+        self.ponderHits = 0
+        self.lastResult = None
+
+        # The process is started fresh rather than forked, so it doesn't inherit a window or a pygame state
+        context = multiprocessing.get_context("spawn")
+        self.currentRequest = context.RawValue("q", 0)
+        self.deadline = context.RawValue("d", 0.0)
+        self.connection, searcherConnection = context.Pipe()
+        self.process = context.Process(target=runSearcher, args=(searcherConnection, self.currentRequest, self.deadline, timeLimit, workers, bookPath))
+        self.process.start()
+        searcherConnection.close()
+
+        self.listener = threading.Thread(target=self.listen, daemon=True)
+        self.listener.start()
+
+    # Wait for results and pass on the ones that are still wanted
+    def listen(self):
+        while True:
+            try:
+                result = self.connection.recv()
+            except (EOFError, OSError):
+                break
+            self.lastResult = result
+            if result.request == self.currentRequest.value and self.ponderPosition is None and self.onResult is not None:
+                self.onResult(result)
+
+    def sendRequest(self, position, pondering):
+        request = self.nextRequest
+        self.nextRequest += 1
+        self.deadline.value = NO_DEADLINE if pondering else time.time() + self.timeLimit
+        self.currentRequest.value = request
+        self.connection.send((request, position, pondering))
+        return request
+
+    # Start searching for the best move in a position, abandoning any other
+    # search. Returns the request number its result will have.
+    def search(self, position):
+        if self.ponderPosition is not None and self.ponderPosition == position:
+            # Ponder hit: keep the search going, with the time for a move from now
+            self.ponderPosition = None
+            self.ponderHits += 1
+            self.deadline.value = time.time() + self.timeLimit
+            result = self.lastResult
+            if result is not None and result.request == self.currentRequest.value and self.onResult is not None:
+                # The ponder search had already finished
+                self.onResult(result)
+            return self.currentRequest.value
+        self.ponderPosition = None
+        return self.sendRequest(position, False)
+
+    # Start searching a position the computer expects to have to move in next
+    def ponder(self, position):
+        self.ponderPosition = position
+        self.sendRequest(position, True)
+
+    # Abandon the current search or ponder
+    def cancel(self):
+        self.ponderPosition = None
+        self.currentRequest.value = 0
+
+    def close(self):
+        self.cancel()
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join()
+        self.connection.close()
@@ -0,0 +1,114 @@
+#
+# Batched move generation
+#
+# Finds the moves for thousands of positions at once with NumPy. The bitboard
+# shifts from bitboard.py work on whole arrays of bitboards just as well as on
+# single integers, so there are no Python loops over positions or squares.
+#
+# Positions are int8 arrays of Player values (see rules.py), either
+# (N, 8, 8) indexed [n][y][x] like the board, or (N, 32) indexed by square.
+#
+# Run this file to check it against rules.legalMoves on random positions:
+#   python3 batchMoves.py 10000
+#
+
+import sys
+import time
+from collections import namedtuple
+import numpy as np
+from rules import *
+
+# Result of getMoveMasks. All are boolean arrays for the player to move.
+#   captures[n, d, s]  the piece on square s can jump in direction d
+#   quiet[n, d, s]     the piece on square s can step into an empty square in direction d
+#                      (whether or not a capture elsewhere makes it illegal)
+#   selectable[n, s]   the piece on square s can start a legal move (captures are compulsory)
+MoveMasks = namedtuple('MoveMasks', ['captures', 'quiet', 'selectable'])
+
+# Board index (y*8 + x) of each square, for reading (N, 8, 8) positions
+DARK_SQUARES = np.array([y*8 + x for x, y in SQUARE_TO_INDEX])
+
+# Value of each square's bit, and the shifts that unpack bitboards again
+SQUARE_BITS = np.array([1 << square for square in range(32)], dtype=np.int64)
+SQUARE_SHIFTS = np.arange(32, dtype=np.int64)
+
+# Square a piece lands on moving/jumping from each square in each direction (-1 if off the board)
+STEP_TARGETS = np.array([[NEIGHBOURS[direction][1 << square].bit_length() - 1 for square in range(32)] for direction in ALL_DIRECTIONS])
+JUMP_TARGETS = np.array([[JUMPS[direction][1 << square].bit_length() - 1 for square in range(32)] for direction in ALL_DIRECTIONS])
+
+#
+# Helper Functions
+#
+
+# Convert positions to (white, yellow, kings) arrays of bitboards
+def toBitboards(positions):
+    positions = np.asarray(positions, dtype=np.int8)
+    if positions.ndim == 3:
+        positions = positions.reshape(len(positions), 64)[:, DARK_SQUARES]
+    white = ((positions == Player.ONE.value) | (positions == Player.ONE_KING.value)).astype(np.int64) @ SQUARE_BITS
+    yellow = ((positions == Player.TWO.value) | (positions == Player.TWO_KING.value)).astype(np.int64) @ SQUARE_BITS
+    kings = ((positions == Player.ONE_KING.value) | (positions == Player.TWO_KING.value)).astype(np.int64) @ SQUARE_BITS
+    return (white, yellow, kings)
+
+# Convert an array of bitboards to an (N, 32) boolean array
+def unpackBitboards(bitboards):
+    return ((bitboards[..., np.newaxis] >> SQUARE_SHIFTS) & 1).astype(bool)
+
+# Find the moves available to the player to move in every position.
+# players is a Player, or an array of Player values, saying whose turn it is.
+def getMoveMasks(positions, players):
+    white, yellow, kings = toBitboards(positions)
+    playerValues = players.value if isinstance(players, Player) else np.asarray(players)
+    isPlayerOne = np.broadcast_to(playerValues == Player.ONE.value, white.shape)
+
+    own = np.where(isPlayerOne, white, yellow)
+    opponents = np.where(isPlayerOne, yellow, white)
+    ownKings = own & kings
+    empty = FULL & ~(white | yellow)
+
+    captures = []
+    quiet = []
+    for direction in ALL_DIRECTIONS:
+        # Men only move forward, which is down the board for player one and up for player two
+        movable = np.where(isPlayerOne, own if direction in DOWN else ownKings, own if direction in UP else ownKings)
+        back = OPPOSITE[direction]
+        quiet.append(step(empty, back) & movable)
+        captures.append(step(step(empty, back) & opponents, back) & movable)
+
+    jumpers = captures[0] | captures[1] | captures[2] | captures[3]
+    movers = quiet[0] | quiet[1] | quiet[2] | quiet[3]
+    selectable = np.where(jumpers != 0, jumpers, movers)
+    return MoveMasks(unpackBitboards(np.stack(captures, axis=1)), unpackBitboards(np.stack(quiet, axis=1)), unpackBitboards(selectable))
+
+# Check getMoveMasks against rules.legalMoves on random positions
+def verify(numPositions, seed=0):
+    generator = np.random.default_rng(seed)
+    pieces = generator.choice(5, size=(numPositions, 32), p=[0.6, 0.12, 0.08, 0.12, 0.08]).astype(np.int8)
+    players = generator.choice([Player.ONE.value, Player.TWO.value], size=numPositions)
+
+    startTime = time.time()
+    masks = getMoveMasks(pieces, players)
+    elapsed = time.time() - startTime
+
+    for n in range(numPositions):
+        white = yellow = kings = 0
+        for square in range(32):
+            piece = Player(int(pieces[n, square]))
+            if isPlayerOne(piece): white |= 1 << square
+            if isPlayerTwo(piece): yellow |= 1 << square
+            if isKing(piece): kings |= 1 << square
+        position = Position(white, yellow, kings, Player(int(players[n])))
+
+        # First steps of every legal move, against the masks
+        expected = set((move.path[0], move.path[1]) for move in legalMoves(position))
+        hasCaptures = masks.captures[n].any()
+        targets = JUMP_TARGETS if hasCaptures else STEP_TARGETS
+        directions, squares = np.nonzero(masks.captures[n] if hasCaptures else masks.quiet[n])
+        found = set((int(square), int(targets[direction, square])) for direction, square in zip(directions, squares))
+        selectable = set(int(square) for square in np.nonzero(masks.selectable[n])[0])
+        if found != expected or selectable != set(source for source, target in expected):
+            raise AssertionError("Batched moves disagree with rules.legalMoves for %r" % (position,))
+    print("%d positions agree (%.0f positions/sec batched)" % (numPositions, numPositions / max(elapsed, 1e-9)))
+
+if __name__ == "__main__":
+    verify(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
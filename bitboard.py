@@ -0,0 +1,151 @@
+#
+# Bitboard helpers
+#
+# Only the 32 dark squares of the board can ever hold a piece, so a set of
+# pieces fits in a single 32 bit integer. The dark squares are numbered 0-31,
+# four to a row, going down the board:
+#
+#   square = 4*y + x//2        (dark squares are the ones where (x+y) is even)
+#
+# Player.ONE (white) starts on squares 0-11 and moves down the board (y+1),
+# Player.TWO (yellow) starts on squares 20-31 and moves up the board (y-1).
+#
+
+FULL = 0xFFFFFFFF
+
+# Directions, in the same order the original rules checked them
+DOWN_LEFT  = 0  # (x-1, y+1)
+DOWN_RIGHT = 1  # (x+1, y+1)
+UP_LEFT    = 2  # (x-1, y-1)
+UP_RIGHT   = 3  # (x+1, y-1)
+
+DOWN = (DOWN_LEFT, DOWN_RIGHT)
+UP = (UP_LEFT, UP_RIGHT)
+ALL_DIRECTIONS = (DOWN_LEFT, DOWN_RIGHT, UP_LEFT, UP_RIGHT)
+OPPOSITE = (UP_RIGHT, UP_LEFT, DOWN_RIGHT, DOWN_LEFT)
+
+# Row and column masks
+ROWS = [0xF << (4*y) for y in range(8)]
+EVEN_ROWS = ROWS[0] | ROWS[2] | ROWS[4] | ROWS[6]
+ODD_ROWS = ROWS[1] | ROWS[3] | ROWS[5] | ROWS[7]
+LEFT_EDGE = 0x01010101   # x == 0
+RIGHT_EDGE = 0x80808080  # x == 7
+
+# Neighbouring squares are 3, 4 or 5 squares apart depending on the parity of
+# the row, so each direction is a pair of (sources mask, shift) entries. The
+# masks strip out squares whose neighbour would fall off the board.
+STEPS = (
+    ((EVEN_ROWS & ~LEFT_EDGE, 3), (ODD_ROWS & ~ROWS[7], 4)),                  # DOWN_LEFT
+    ((EVEN_ROWS, 4), (ODD_ROWS & ~ROWS[7] & ~RIGHT_EDGE, 5)),                 # DOWN_RIGHT
+    ((EVEN_ROWS & ~ROWS[0] & ~LEFT_EDGE, -5), (ODD_ROWS, -4)),                # UP_LEFT
+    ((EVEN_ROWS & ~ROWS[0], -4), (ODD_ROWS & ~RIGHT_EDGE, -3)),               # UP_RIGHT
+)
+
+# Lookup tables between board indices and squares
+SQUARE_TO_INDEX = [((square % 4)*2 + ((square//4) % 2), square//4) for square in range(32)]
+BIT_AT = [[(1 << (4*y + x//2)) if (x+y) % 2 == 0 else 0 for x in range(8)] for y in range(8)]
+BIT_TO_INDEX = dict(((1 << square), SQUARE_TO_INDEX[square]) for square in range(32))
+
+#
+# Helper Functions
+#
+
+# Square number (0-31) of the board index (x,y), or None for a light square
+def squareFromIndex(x, y):
+    if (x+y) % 2 != 0: return None
+    return 4*y + x//2
+
+# Board index (x,y) of a square number
+def indexFromSquare(square):
+    return SQUARE_TO_INDEX[square]
+
+# Move every piece in the bitboard one square in the given direction.
+# Pieces that would leave the board are dropped.
+def step(bitboard, direction):
+    (maskA, shiftA), (maskB, shiftB) = STEPS[direction]
+    if shiftA > 0:
+        return ((bitboard & maskA) << shiftA) | ((bitboard & maskB) << shiftB)
+    return ((bitboard & maskA) >> -shiftA) | ((bitboard & maskB) >> -shiftB)
+
+# Single square neighbours for each direction, keyed by the bit of the source
+# square. Used when only one piece's moves are needed.
+NEIGHBOURS = [dict(((1 << square), step(1 << square, direction)) for square in range(32)) for direction in ALL_DIRECTIONS]
+JUMPS = [dict(((1 << square), step(step(1 << square, direction), direction)) for square in range(32)) for direction in ALL_DIRECTIONS]
+
+# Squares within two diagonal steps of each square (and the square itself).
+# A piece's next step or jump only depends on what is on these squares.
+NEARBY = []
+for square in range(32):
+    nearby = 1 << square
+    for direction in ALL_DIRECTIONS:
+        nearby |= NEIGHBOURS[direction][1 << square] | JUMPS[direction][1 << square]
+    NEARBY.append(nearby)
+
+# The directions a piece may move in. Kings may use all of them.
+def getDirections(forward, isKing):
+    return ALL_DIRECTIONS if isKing else forward
+
+# The source masks of STEPS by name, for the unrolled shifts below
+DOWN_LEFT_A, DOWN_LEFT_B = STEPS[DOWN_LEFT][0][0], STEPS[DOWN_LEFT][1][0]
+DOWN_RIGHT_A, DOWN_RIGHT_B = STEPS[DOWN_RIGHT][0][0], STEPS[DOWN_RIGHT][1][0]
+UP_LEFT_A, UP_LEFT_B = STEPS[UP_LEFT][0][0], STEPS[UP_LEFT][1][0]
+UP_RIGHT_A, UP_RIGHT_B = STEPS[UP_RIGHT][0][0], STEPS[UP_RIGHT][1][0]
+
+# Pieces that can make a quiet (non capturing) move into an empty square.
+# The steps are written out rather than calling step, as this is called for
+# every position a search looks at.
+def getMovers(pieces, kings, forward, empty):
+    movers = 0
+    down = pieces if DOWN_LEFT in forward else pieces & kings
+    if down:
+        # Step the empty squares back up: a piece there can move down into them
+        movers |= ((((empty & UP_RIGHT_A) >> 4) | ((empty & UP_RIGHT_B) >> 3)) |
+                   (((empty & UP_LEFT_A) >> 5) | ((empty & UP_LEFT_B) >> 4))) & down
+    up = pieces if UP_LEFT in forward else pieces & kings
+    if up:
+        movers |= ((((empty & DOWN_RIGHT_A) << 4) | ((empty & DOWN_RIGHT_B) << 5)) |
+                   (((empty & DOWN_LEFT_A) << 3) | ((empty & DOWN_LEFT_B) << 4))) & up
+    return movers
+
+# Pieces that can jump an opponent and land on a square in the landing mask.
+# Written out like getMovers.
+def getJumpers(pieces, kings, forward, opponents, landing):
+    jumpers = 0
+    down = pieces if DOWN_LEFT in forward else pieces & kings
+    if down:
+        # Step the landing squares back up over an opponent
+        over = (((landing & UP_RIGHT_A) >> 4) | ((landing & UP_RIGHT_B) >> 3)) & opponents
+        jumpers |= (((over & UP_RIGHT_A) >> 4) | ((over & UP_RIGHT_B) >> 3)) & down
+        over = (((landing & UP_LEFT_A) >> 5) | ((landing & UP_LEFT_B) >> 4)) & opponents
+        jumpers |= (((over & UP_LEFT_A) >> 5) | ((over & UP_LEFT_B) >> 4)) & down
+    up = pieces if UP_LEFT in forward else pieces & kings
+    if up:
+        over = (((landing & DOWN_RIGHT_A) << 4) | ((landing & DOWN_RIGHT_B) << 5)) & opponents
+        jumpers |= (((over & DOWN_RIGHT_A) << 4) | ((over & DOWN_RIGHT_B) << 5)) & up
+        over = (((landing & DOWN_LEFT_A) << 3) | ((landing & DOWN_LEFT_B) << 4)) & opponents
+        jumpers |= (((over & DOWN_LEFT_A) << 3) | ((over & DOWN_LEFT_B) << 4)) & up
+    return jumpers
+
+# Number of pieces in a bitboard
+def popCount(bitboard):
+    return bin(bitboard).count("1")
+
+if hasattr(int, "bit_count"):
+    def popCount(bitboard):
+        return bitboard.bit_count()
+
+# Each byte with its bits in reverse order
+REVERSED_BYTES = [int("{:08b}".format(byte)[::-1], 2) for byte in range(256)]
+
+# The bitboard turned around 180 degrees, so each side's pieces end up where
+# the other side's started. Square s moves to square 31 - s.
+def rotateBoard(bitboard):
+    return (REVERSED_BYTES[bitboard & 0xFF] << 24 | REVERSED_BYTES[(bitboard >> 8) & 0xFF] << 16 |
+            REVERSED_BYTES[(bitboard >> 16) & 0xFF] << 8 | REVERSED_BYTES[bitboard >> 24])
+
+# Yield the square number of every piece in a bitboard, lowest first
+def iterSquares(bitboard):
+    while bitboard:
+        lowest = bitboard & -bitboard
+        yield lowest.bit_length() - 1
+        bitboard ^= lowest
@@ -1,6 +1,7 @@
 import pygame
-from enum import Enum
 import math
+from bitboard import *
+from rules import *
 
 # Colors
 BLACK = (0,0,0)
@@ -16,47 +17,9 @@ class Square:
     HIGHLIGHT = (95,90,255)
     LEGAL = (200,255,100)
 
-class Player(Enum):
-    NONE       = 0
-    ONE        = 1
-    ONE_KING   = 2
-    TWO        = 3
-    TWO_KING   = 4
-
 #
 # Helper Functions
 #
-def isPlayersPiece(player, piece):
-    return (isPlayerOne(player) and isPlayerOne(piece)) or (isPlayerTwo(player) and isPlayerTwo(piece))
-
-def selfOrNone(piece, pieceInQuestion):
-    if pieceInQuestion is Player.NONE: return True
-    return isPlayersPiece(piece, pieceInQuestion)
-
-def isPlayerOne(player):
-    return player is Player.ONE or player is Player.ONE_KING
-
-def isPlayerTwo(player):
-    return player is Player.TWO or player is Player.TWO_KING
-
-def getOpponent(player):
-    if isPlayerOne(player): return Player.TWO
-    return Player.ONE
-
-def areOpponents(x,y):
-    return (isPlayerOne(x) and isPlayerTwo(y)) or (isPlayerTwo(x) and isPlayerOne(y))
-
-def isKing(player):
-    if player is Player.ONE_KING or player is Player.TWO_KING: return True
-    return False
-
-def getKing(piece):
-    if isPlayerOne(piece):
-        return Player.ONE_KING
-    if isPlayerTwo(piece):
-        return Player.TWO_KING
-    return Player.NONE
-
 def getPlayerColor(player):
     if player is Player.ONE or player is Player.ONE_KING: return (200,200,200)
     if player is Player.TWO or player is Player.TWO_KING: return (250,250,100)
@@ -96,12 +59,8 @@ class CheckersBoard(object):
         self.drawingBoard = [[Square.LIGHT if (x+(y % 2)) % 2 == 0 else Square.DARK for x in range(8)] for y in range(8)]
         self.highLight = None
 
-        # Create initial player placement
-        self.board = [[Player.NONE for x in range(8)] for y in range(8)]
-        for i in range(3):
-            for j in range(4):
-                self.board[i][j*2+(i%2)] = Player.ONE
-                self.board[len(self.board)-1-i][j*2+((i+1)%2)] = Player.TWO
+        # Create initial player placement (see rules.py)
+        self.position = startingPosition()
 
         # Piece currently being dragged
         self.draggingPiece = None
@@ -113,8 +72,9 @@ class CheckersBoard(object):
         # Which pieces will be destroyed if the move completes
         self.choppingBlock = []
 
-        # Who the winner is
+        # Who the winner is, and the text announcing it
         self.winner = None
+        self.winnerLabel = None
 
     # Declare the game over and who won. This is acted upon in the draw function
     def gameOver(self, winner):
@@ -143,17 +103,19 @@ class CheckersBoard(object):
         if x < self.boardSize-1 and x > 0 and y < self.boardSize-1 and y > 0:
             xIdx = x//self.squareSize
             yIdx = y//self.squareSize
-            if self.board[yIdx][xIdx] is not None:
-                return (xIdx, yIdx, self.board[yIdx][xIdx])
+            return (xIdx, yIdx, self.get(xIdx, yIdx))
         return None
 
     # Return a list of tuples containing the index of the pieces and which piece it is.
     def getPieceData(self, player):
+        return self.getPieceDataFromBitboard(getSides(self.position, player)[0])
+
+    # Return the piece data tuples for every piece in the given bitboard
+    def getPieceDataFromBitboard(self, bitboard):
         pieces = []
-        for x in range(8):
-            for y in range(8):
-                if isPlayersPiece(player, self.board[y][x]):
-                    pieces.append((x,y,self.board[y][x]))
+        for square in iterSquares(bitboard):
+            x,y = indexFromSquare(square)
+            pieces.append((x,y,self.get(x,y)))
         return pieces
 
     # Return the game board indices (x,y) of the mouse position
@@ -176,14 +138,19 @@ class CheckersBoard(object):
 
     # Get the piece at this location of the game board
     def get(self, x, y):
-        return self.board[y][x]
+        return getPiece(self.position, x, y)
 
     # Draw the winning text over the screen if someone won
     def drawWinner(self, screen):
         if self.winner:
+            screen.blit(self.getWinnerLabel(), (105, 200))
+
+    # The rendered winning text. It only needs rendering once.
+    def getWinnerLabel(self):
+        if self.winnerLabel is None or self.winnerLabel[0] is not self.winner:
             font = pygame.font.Font(None, 65)
-            label = font.render(getPlayerText(self.winner), 3, (50,50,230))
-            screen.blit(label, (105, 200))
+            self.winnerLabel = (self.winner, font.render(getPlayerText(self.winner), 3, (50,50,230)))
+        return self.winnerLabel[1]
 
     # Draw the board itself
     def drawGrid(self, screen):
@@ -205,12 +172,7 @@ class CheckersBoard(object):
 
     # Return the number of pieces the given player has left on the board
     def getNumberOfPlayer(self, player):
-        numPlayer = 0
-        for x in range(len(self.board)):
-            for y in range(len(self.board[x])):
-                if isPlayersPiece(player, self.board[x][y]):
-                    numPlayer += 1
-        return numPlayer
+        return countPieces(self.position, player)
 
     # Draw all the pieces on the board
     def drawPieces(self, screen):
@@ -225,12 +187,12 @@ class CheckersBoard(object):
                 if self.draggingPiece is not None:
                     ((idxX, idxY, piece), (xPos,yPos)) = self.draggingPiece
                     if idxX == x and idxY == y:
-                        draggingPiece = ((x,y,self.board[y][x]), (xPos, yPos))
+                        draggingPiece = ((x,y,self.get(x,y)), (xPos, yPos))
                         skip = True
 
                 # Actually draw the piece
                 if not skip:
-                    self.drawPiece(screen, (x,y,self.board[y][x]), drawPos)
+                    self.drawPiece(screen, (x,y,self.get(x,y)), drawPos)
         if draggingPiece is not None:
             self.drawPiece(screen, draggingPiece[0], draggingPiece[1])
 
@@ -248,15 +210,18 @@ class CheckersBoard(object):
 
     # Draw an individual piece
     def drawPiece(self, screen, pieceData, pos):
-        x,y = pos
-        size = self.squareSize
         xIdx, yIdx, piece = pieceData
+        self.drawPieceShape(screen, piece, pos, (xIdx, yIdx) in self.game.selectableSquares, (xIdx, yIdx) in self.choppingBlock)
+
+    # Draw a piece centred on pos, highlighted if it's selectable and crossed out if it's on the chopping block
+    def drawPieceShape(self, screen, piece, pos, selectable, chopped):
+        x,y = pos
 
         if piece is Player.NONE:
             return
 
         # Draw circle and black outline
-        if pieceData in self.game.selectablePieces:
+        if selectable:
             pygame.draw.circle(screen, GRAY, pos, int(self.pieceSize*1.15), 0)
         else:
             pygame.draw.circle(screen, BLACK, pos, int(self.pieceSize*1.15), 0)
@@ -269,7 +234,7 @@ class CheckersBoard(object):
             pygame.draw.lines(screen, BLACK, False, [(x-thickness//2, y-self.pieceSize), (x-thickness//2, y+self.pieceSize)], thickness)
 
         # Draw X if it's gonna get all dead
-        if (xIdx, yIdx) in self.choppingBlock:
+        if chopped:
             thickness=2
             # Red X coordinates
             upLeftX = x + (self.pieceSize*math.cos(math.pi*3.0/4.0))
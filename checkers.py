@@ -8,9 +8,14 @@
 
 # Imports
 import sys
+import argparse
 import pygame
 from board import *
 from gameLogic import Game
+from backgroundSearch import BackgroundSearch
+from renderer import SpriteRenderer
+from scheduler import FrameScheduler
+from profiler import Profiler
 
 # Colors
 red = (255,0,0)
@@ -21,13 +26,20 @@ white = (255,255,255)
 black = (0,0,0)
 pink = (255,200,200)
 
-# Setup
-pygame.init()
-screen = pygame.display.set_mode((480,480)) # Setup Screen
-pygame.display.set_caption("Checkers")
-board = CheckersBoard()
-game = Game(board)
-board.setGameObject(game)
+# Set up in main() so the module can be imported without opening a window
+screen = None
+board = None
+game = None
+renderer = None
+scheduler = None
+profiler = None
+profileFont = None
+
+# Area of the screen the profiling overlay is drawn in
+PROFILE_OVERLAY_RECT = pygame.Rect(0, 0, 360, 164)
+
+# Event posted when the computer's background search finds its move
+SEARCH_DONE = pygame.USEREVENT
 
 # Update
 def update():
@@ -36,13 +48,51 @@ def update():
 
 # Draw
 def draw():
+    # Only redraw and push the parts of the screen that changed
+    if renderer is not None:
+        if profiler is None:
+            pygame.display.update(renderer.draw(screen))
+        else:
+            # The overlay changes every frame, so the board under it is redrawn every frame too
+            dirty = renderer.draw(screen, [PROFILE_OVERLAY_RECT])
+            drawProfileOverlay()
+            pygame.display.update(dirty)
+        return
+
     # Clear the screen
     screen.fill((100,100,100))
     # Draw Checkers Board
     board.draw(screen)
+    if profiler is not None:
+        drawProfileOverlay()
     # Write the buffer
     pygame.display.update()
 
+# Draw the profiler's measurements of the last frame over the top left of the board
+def drawProfileOverlay():
+    global profileFont
+    if profileFont is None:
+        profileFont = pygame.font.Font(None, 18)
+    overlay = pygame.Surface(PROFILE_OVERLAY_RECT.size, pygame.SRCALPHA)
+    overlay.fill((0,0,0,170))
+    for line, text in enumerate(profiler.getOverlayLines()):
+        overlay.blit(profileFont.render(text, True, white), (4, 4 + 14*line))
+    screen.blit(overlay, PROFILE_OVERLAY_RECT)
+
+# Measure the frame's parts and the functions on the hot path
+def startProfiling(output, interval):
+    global profiler
+    profiler = Profiler(output, interval)
+    profiler.instrument(sys.modules[__name__], "handlePygameEvents", "handlePygameEvents")
+    profiler.instrument(Game, "update")
+    profiler.instrument(CheckersBoard, "update")
+    profiler.instrument(CheckersBoard, "draw")
+    profiler.instrument(SpriteRenderer, "draw")
+    profiler.instrument(Game, "getHops")
+    profiler.instrument(Game, "getLegalMoves")
+    profiler.instrument(CheckersBoard, "getPieceData")
+    profiler.instrument(CheckersBoard, "getPieceDataFromBitboard")
+
 # Handle Mouse Down
 def handleMouseDown(pos):
     if board.currentMoveSequence:
@@ -76,8 +126,8 @@ def handleMouseUp(pos):
 
 # Get the indices of the last location the user tried to jump to
 def getLastHop():
-    if board.currentMoveSequence and len(board.currentMoveSequence) > 1:
-        return board.getIndexFromPosition(board.currentMoveSequence[-2])
+    if game.movePath:
+        return indexFromSquare(game.movePath[-1])
     return None
 
 # Handle trying to move to a position
@@ -96,20 +146,42 @@ def handleMoveSelection(pos):
             # Wasn't a legal move, so snap back to where we were
             (y,x,_),_ = board.draggingPiece
             board.draggingPieceTarget = board.getPiecePositionFromIndex(y, x)
-            board.currentMoveSequence = []
-            board.choppingBlock = []
+            game.cancelMove()
 
-# Figure out if the player can touch this piece (has to be thier piece)
+# Figure out if the player can touch this piece (has to be thier piece, and
+# not while the computer is thinking about its move)
 def ableToDragPiece(pieceData):
-    if board.draggingPiece is not None or pieceData is None:
+    if board.draggingPiece is not None or pieceData is None or game.computerPlayer is game.currentPlayer:
         return False
     (x,y,piece) = pieceData
     return isPlayersPiece(game.currentPlayer, piece)
 
+# Handle a key press. U / Ctrl+Z takes back a move and R / Ctrl+Y plays it again.
+def handleKeyDown(event):
+    ctrl = event.mod & pygame.KMOD_CTRL
+    if event.key == pygame.K_u or (ctrl and event.key == pygame.K_z):
+        game.undoMove()
+    elif event.key == pygame.K_r or (ctrl and event.key == pygame.K_y):
+        game.redoMove()
+
+# Whether anything on screen is moving (or about to move) so frames need ticking
+def isAnimating():
+    if board.draggingPiece is not None:
+        return True
+    # The computer starts thinking and plays its move in the update loop. While
+    # it thinks the loop can sleep, as its result arrives as an event.
+    return game.isComputerWaiting()
+
+# Hand a background search's result to the game loop. Called from the search's thread.
+def postSearchResult(searchResult):
+    pygame.event.post(pygame.event.Event(SEARCH_DONE, result=searchResult))
+
 # Handle Pygame Events
-def handlePygameEvents():
-    for event in pygame.event.get():
+def handlePygameEvents(events):
+    for event in events:
         if event.type == pygame.QUIT:
+            if game.searcher is not None:
+                game.searcher.close()
             pygame.quit()
             sys.exit()
         elif event.type == pygame.MOUSEBUTTONDOWN:
@@ -118,9 +190,59 @@ def handlePygameEvents():
             handleMouseUp(pygame.mouse.get_pos())
         elif event.type == pygame.MOUSEMOTION:
             handleMouseMoved(pygame.mouse.get_pos())
+        elif event.type == pygame.KEYDOWN:
+            handleKeyDown(event)
+        elif event.type == SEARCH_DONE:
+            game.handleSearchResult(event.result)
+        elif event.type == pygame.VIDEOEXPOSE and renderer is not None:
+            # The window contents were lost, so the next frame has to be drawn in full
+            renderer.invalidate()
+
+# Setup and run the game loop
+def main():
+    global screen, board, game, renderer, scheduler
+    parser = argparse.ArgumentParser(description="Checkers")
+    parser.add_argument("--computer", choices=["white", "yellow"], help="let the computer play this colour")
+    parser.add_argument("--think", type=float, default=1.0, help="seconds the computer may think per move")
+    parser.add_argument("--workers", type=int, default=1, help="processes the computer searches with")
+    parser.add_argument("--book", help="opening book the computer plays its first moves from (see openingBook.py)")
+    parser.add_argument("--full-redraw", action="store_true", help="redraw the whole board every frame")
+    parser.add_argument("--fps", type=int, default=60, help="frame rate cap while pieces are moving")
+    parser.add_argument("--show-frame-time", action="store_true", help="show the measured frame time in the window title")
+    parser.add_argument("--profile", action="store_true", help="measure each frame and show the measurements over the board")
+    parser.add_argument("--profile-output", help="with --profile, append the measurements to this file (JSON lines, or CSV for a .csv file)")
+    parser.add_argument("--profile-interval", type=float, default=5.0, help="seconds between writes to --profile-output (default: 5)")
+    args = parser.parse_args()
+
+    if args.profile:
+        startProfiling(args.profile_output, args.profile_interval)
+
+    pygame.init()
+    screen = pygame.display.set_mode((480,480)) # Setup Screen
+    pygame.display.set_caption("Checkers")
+    board = CheckersBoard()
+    game = Game(board)
+    board.setGameObject(game)
+    if not args.full_redraw:
+        screen.fill((100,100,100))
+        renderer = SpriteRenderer(board)
+    if args.computer:
+        searcher = BackgroundSearch(args.think, args.workers, postSearchResult, args.book)
+        game.setComputerPlayer(Player.ONE if args.computer == "white" else Player.TWO, searcher)
+
+    # Game Loop. Sleeps until the next event while nothing is moving.
+    scheduler = FrameScheduler(args.fps)
+    while True:
+        events = scheduler.getEvents(isAnimating())
+        if profiler is not None:
+            profiler.startFrame()
+        handlePygameEvents(events)
+        update()
+        draw()
+        if profiler is not None:
+            profiler.endFrame()
+        if args.show_frame_time and scheduler.frameTime:
+            pygame.display.set_caption("Checkers - %d ms/frame (%.1f ms work)" % (scheduler.frameTime, scheduler.workTime))
 
-# Game Loop
-while True:
-    handlePygameEvents()
-    update()
-    draw()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+#!/usr/local/bin/python3
+#
+# Board diagrams
+#
+# Renders positions, and games a move at a time, to PNG files without opening
+# a window. Diagrams are drawn by a SpriteRenderer onto an offscreen surface,
+# so they look exactly like the game: the same squares, pieces, kings,
+# selectable highlights and chopping block X marks. Each worker process keeps
+# one renderer, so the board and the piece sprites are only drawn once per
+# process, and frames of a game only redraw the squares that changed.
+#
+# Drawing a diagram takes well under a millisecond, so the time goes on
+# compressing the PNG files. They are written with a quick zlib level by
+# default, which is several times faster than pygame.image.save for files a
+# few times bigger; --compression 9 makes small files slowly.
+#
+# A game's frames are the position before each move, with the move's path
+# drawn and the pieces it captures crossed out, then the final position.
+# --steps adds frames of the piece moving along the path, for animations.
+#
+#   python3 diagrams.py positions fens.txt --output diagrams     one PNG per FEN (or "start") line
+#   python3 diagrams.py games archive.pdn results.txt --output frames --steps 4 --workers 8
+#
+
+import os
+import sys
+import time
+import zlib
+import struct
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+# Nothing is shown on screen, so SDL doesn't need a real display
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+from board import *
+from renderer import SpriteRenderer
+
+#
+# DiagramRenderer Class
+#
+# Draws diagrams onto one offscreen surface. It stands in for the Game the
+# board normally asks which pieces are selectable.
+#
+class DiagramRenderer(object):
+    def __init__(self, boardSize=480):
+        self.board = CheckersBoard(boardSize)
+        self.board.setGameObject(self)
+        self.selectableSquares = set()
+        self.visibleLegalMoves = []
+        self.renderer = SpriteRenderer(self.board)
+        self.surface = pygame.Surface((boardSize, boardSize))
+
+    # Draw a position. A move is drawn as the path its piece takes, with the
+    # pieces it captures crossed out; progress (0-1) moves the piece along it.
+    def draw(self, position, move=None, progress=0.0, showSelectable=False, showWinner=False):
+        board = self.board
+        board.position = position
+        board.currentMoveSequence = []
+        board.choppingBlock = []
+        board.draggingPiece = None
+        board.draggingPieceTarget = None
+        if move is not None:
+            points = [board.getPiecePositionFromIndex(*indexFromSquare(square)) for square in move.path]
+            board.currentMoveSequence = points
+            board.choppingBlock = [indexFromSquare(square) for square in iterSquares(move.captures)]
+            if progress > 0.0:
+                x,y = indexFromSquare(move.path[0])
+                board.draggingPiece = ((x, y, board.get(x, y)), getPointAlongPath(points, progress))
+                board.draggingPieceTarget = points[-1]
+        selectable = getSelectable(position) if showSelectable else 0
+        self.selectableSquares = set(indexFromSquare(square) for square in iterSquares(selectable))
+        board.winner = result(position) if showWinner else None
+        self.renderer.draw(self.surface)
+        return self.surface
+
+    def save(self, path, compression=1):
+        writePng(self.surface, path, compression)
+
+# Write a surface to a PNG file, compressed with zlib at the given level (0-9)
+def writePng(surface, path, compression=1):
+    width, height = surface.get_size()
+    pixels = pygame.image.tobytes(surface, "RGB")
+    rowBytes = width * 3
+    # Each row starts with its filter type, 0 (none)
+    rows = b"".join(b"\0" + pixels[row * rowBytes:(row + 1) * rowBytes] for row in range(height))
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+    with open(path, "wb") as output:
+        output.write(b"\x89PNG\r\n\x1a\n")
+        output.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        output.write(chunk(b"IDAT", zlib.compress(rows, compression)))
+        output.write(chunk(b"IEND", b""))
+
+# The point a fraction (0-1) of the way along a path of points
+def getPointAlongPath(points, fraction):
+    lengths = [math.hypot(x2 - x1, y2 - y1) for (x1, y1), (x2, y2) in zip(points, points[1:])]
+    distance = fraction * sum(lengths)
+    for ((x1, y1), (x2, y2)), length in zip(zip(points, points[1:]), lengths):
+        if distance <= length and length > 0:
+            part = distance / length
+            return (int(round(x1 + (x2 - x1) * part)), int(round(y1 + (y2 - y1) * part)))
+        distance -= length
+    return points[-1]
+
+#
+# Workers
+#
+
+# The renderer of this worker process
+diagramRenderer = None
+
+def getRenderer(boardSize):
+    global diagramRenderer
+    if diagramRenderer is None or diagramRenderer.board.boardSize != boardSize:
+        pygame.font.init()
+        diagramRenderer = DiagramRenderer(boardSize)
+    return diagramRenderer
+
+# Render a chunk of (file name, FEN) diagrams. Invalid FENs are reported and
+# skipped. Returns the numbers of diagrams written and skipped.
+def renderPositions(items, boardSize, showSelectable, compression):
+    from pdn import PdnError, parseFen
+    renderer = getRenderer(boardSize)
+    skipped = 0
+    for path, text in items:
+        try:
+            position = startingPosition() if text == "start" else parseFen(text)
+        except PdnError as error:
+            print("%s: %s" % (os.path.basename(path), error), file=sys.stderr)
+            skipped += 1
+            continue
+        renderer.draw(position, showSelectable=showSelectable, showWinner=True)
+        renderer.save(path, compression)
+    return (len(items) - skipped, skipped)
+
+# Render the frames of one game into a directory. The game is a PdnGame or a
+# line of a simulate.py results file. An invalid game is reported and skipped.
+# Returns the numbers of frames written and games skipped.
+def renderGame(directory, game, boardSize, showSelectable, steps, compression):
+    from pdn import PdnError, replayGame, readResult
+    try:
+        if isinstance(game, str):
+            record = readResult(game)
+            if record is None:
+                raise PdnError("not a game: %r" % game.strip())
+            number, winner, moves, finalPosition = record
+            position = startingPosition()
+        else:
+            position, moves = replayGame(game)
+    except PdnError as error:
+        print("%s: %s" % (os.path.basename(directory), error), file=sys.stderr)
+        return (0, 1)
+
+    renderer = getRenderer(boardSize)
+    renderer.renderer.invalidate()
+    os.makedirs(directory, exist_ok=True)
+    frames = 0
+    def save():
+        renderer.save(os.path.join(directory, "%04d.png" % frames), compression)
+        return frames + 1
+    for move in moves:
+        for step in range(steps):
+            renderer.draw(position, move, step / float(steps), showSelectable)
+            frames = save()
+        position = applyMove(position, move)
+    renderer.draw(position, showSelectable=showSelectable, showWinner=True)
+    return (save(), 0)
+
+# Add up the (written, skipped) results of finished tasks
+def addResults(totals, finished):
+    for task in finished:
+        written, skipped = task.result()
+        totals = (totals[0] + written, totals[1] + skipped)
+    return totals
+
+# Run (function, args) tasks in a pool, keeping only a few more queued than
+# there are workers so a stream of any length is read as it is needed.
+# Tasks return (written, skipped); returns the totals of both.
+def runTasks(pool, workers, tasks):
+    totals = (0, 0)
+    pending = set()
+    for function, args in tasks:
+        pending.add(pool.submit(function, *args))
+        if len(pending) >= workers * 4:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            totals = addResults(totals, done)
+    return addResults(totals, pending)
+
+#
+# Command line
+#
+
+def getPositionTasks(paths, output, boardSize, showSelectable, compression, chunk=64):
+    number = 0
+    items = []
+    for path in paths:
+        with open(path) as lines:
+            for line in lines:
+                text = line.strip()
+                if not text or text.startswith("#"): continue
+                items.append((os.path.join(output, "%06d.png" % number), text))
+                number += 1
+                if len(items) == chunk:
+                    yield (renderPositions, (items, boardSize, showSelectable, compression))
+                    items = []
+    if items:
+        yield (renderPositions, (items, boardSize, showSelectable, compression))
+
+def getGameTasks(paths, output, boardSize, showSelectable, steps, compression):
+    from pdn import readGames
+    number = 0
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as lines:
+            games = readGames(lines) if path.endswith(".pdn") else (line for line in lines if line.strip())
+            for game in games:
+                yield (renderGame, (os.path.join(output, "game%05d" % number), game, boardSize, showSelectable, steps, compression))
+                number += 1
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render board diagrams to PNG files without a window.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument("--output", default="diagrams", help="directory to write the PNG files to (default: diagrams)")
+    options.add_argument("--size", type=int, default=480, help="board size in pixels (default: 480)")
+    options.add_argument("--compression", type=int, default=1, choices=range(10), metavar="0-9", help="PNG compression level, higher is smaller and slower (default: 1)")
+    options.add_argument("--selectable", action="store_true", help="highlight the pieces the player to move can move")
+    options.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes (default: one per core)")
+    positionsParser = subcommands.add_parser("positions", parents=[options], help="one diagram per line of FEN (or \"start\")")
+    positionsParser.add_argument("files", nargs="+")
+    gamesParser = subcommands.add_parser("games", parents=[options], help="a directory of frames per game in PDN or simulate.py results files")
+    gamesParser.add_argument("files", nargs="+")
+    gamesParser.add_argument("--steps", type=int, default=1, help="frames per move; more than 1 animates the piece along its path (default: 1)")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output, exist_ok=True)
+    workers = max(1, args.workers or 1)
+    if args.command == "positions":
+        tasks = getPositionTasks(args.files, args.output, args.size, args.selectable, args.compression)
+    else:
+        tasks = getGameTasks(args.files, args.output, args.size, args.selectable, max(1, args.steps), args.compression)
+
+    startTime = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        written, skipped = runTasks(pool, workers, tasks)
+    elapsed = max(time.time() - startTime, 1e-9)
+    print("%d diagrams in %.2fs (%.0f/sec) written to %s" % (written, elapsed, written / elapsed, args.output))
+    if skipped:
+        print("%d invalid %s skipped" % (skipped, "positions" if args.command == "positions" else "games"))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+import random
+import time
+from rules import *
+
+#
+# Engine
+#
+# A computer player. It searches with negamax, alpha-beta pruning (principal
+# variation search) and iterative deepening under a time budget. Positions are
+# identified by Zobrist hashes and stored in a fixed size transposition table.
+#
+# Moves come from rules.legalMoves, so compulsory captures and whole
+# multi-jumps are part of the search, and captures waiting at the end of the
+# search depth are always played out before a position is evaluated.
+#
+
+# Scores
+WIN = 100000
+MAN_VALUE = 100
+KING_VALUE = 150
+INFINITY = WIN + 1
+
+# Bound types stored in the transposition table
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# Quiet moves searched after this many moves are searched one ply shallower
+# first (late move reductions), as long as there is at least this much depth left
+LATE_MOVES = 3
+REDUCTION_DEPTH = 3
+
+# Each iteration costs at least this many times the one before it (usually
+# two or three times), so there's no point starting one with less time left
+MIN_GROWTH = 1.5
+
+# Check the clock after this many nodes
+NODES_PER_CLOCK_CHECK = 1024
+
+# Rough size in bytes of one transposition table slot, used to turn a
+# memory budget into a number of slots
+ENTRY_BYTES = 144
+
+# Zobrist keys for each kind of piece on each square, and for the player to move
+zobristRandom = random.Random(20160914)
+ZOBRIST_PIECES = dict((piece, [zobristRandom.getrandbits(64) for square in range(32)]) for piece in (Player.ONE, Player.ONE_KING, Player.TWO, Player.TWO_KING))
+ZOBRIST_PLAYER_ONE = zobristRandom.getrandbits(64)
+
+# The (men, kings, opponent men, opponent kings) Zobrist keys for each player
+ZOBRIST_WHITE = (ZOBRIST_PIECES[Player.ONE], ZOBRIST_PIECES[Player.ONE_KING], ZOBRIST_PIECES[Player.TWO], ZOBRIST_PIECES[Player.TWO_KING])
+ZOBRIST_YELLOW = (ZOBRIST_PIECES[Player.TWO], ZOBRIST_PIECES[Player.TWO_KING], ZOBRIST_PIECES[Player.ONE], ZOBRIST_PIECES[Player.ONE_KING])
+
+# Positional masks
+CENTER = 0x00666600  # The middle squares of rows 2-5
+WHITE_ADVANCED = ROWS[4] | ROWS[5] | ROWS[6]
+YELLOW_ADVANCED = ROWS[1] | ROWS[2] | ROWS[3]
+
+#
+# Helper Functions
+#
+
+# Compute the Zobrist hash of a position from scratch
+def getHash(position):
+    key = ZOBRIST_PLAYER_ONE if position.player is Player.ONE else 0
+    for piece, bitboard in ((Player.ONE, position.white & ~position.kings), (Player.ONE_KING, position.white & position.kings),
+                            (Player.TWO, position.yellow & ~position.kings), (Player.TWO_KING, position.yellow & position.kings)):
+        keys = ZOBRIST_PIECES[piece]
+        for square in iterSquares(bitboard):
+            key ^= keys[square]
+    return key
+
+# Update a Zobrist hash for a move. Must be given the position before the move
+# and the position after it.
+def getHashAfterMove(key, position, move, newPosition):
+    source = move.path[0]
+    target = move.path[-1]
+    men, kings, opponentMen, opponentKings = ZOBRIST_WHITE if position.player is Player.ONE else ZOBRIST_YELLOW
+    key ^= ZOBRIST_PLAYER_ONE
+    key ^= (kings if position.kings >> source & 1 else men)[source]
+    key ^= (kings if newPosition.kings >> target & 1 else men)[target]
+    if move.captures:
+        for square in iterSquares(move.captures):
+            key ^= (opponentKings if position.kings >> square & 1 else opponentMen)[square]
+    return key
+
+# Score a position from the point of view of the player to move
+def evaluate(position):
+    white = position.white
+    yellow = position.yellow
+    kings = position.kings
+    whiteMen = white & ~kings
+    yellowMen = yellow & ~kings
+    score = (MAN_VALUE * (popCount(whiteMen) - popCount(yellowMen)) +
+             KING_VALUE * (popCount(white & kings) - popCount(yellow & kings)))
+
+    # Men guarding the back row, pieces in the centre and men that are past
+    # the middle of the board are worth a bit more
+    score += 4 * (popCount(whiteMen & ROWS[0]) - popCount(yellowMen & ROWS[7]))
+    score += 3 * (popCount(white & CENTER) - popCount(yellow & CENTER))
+    score += 2 * (popCount(whiteMen & WHITE_ADVANCED) - popCount(yellowMen & YELLOW_ADVANCED))
+    return score if position.player is Player.ONE else -score
+
+# Win scores are stored in the transposition table relative to the position
+# rather than the root, so they stay correct wherever the position turns up
+def scoreToTable(score, ply):
+    if score > WIN - 1000: return score + ply
+    if score < -WIN + 1000: return score - ply
+    return score
+
+def scoreFromTable(score, ply):
+    if score > WIN - 1000: return score - ply
+    if score < -WIN + 1000: return score + ply
+    return score
+
+# Raised to abandon a search when it runs out of time
+class SearchTimeout(Exception):
+    pass
+
+#
+# TranspositionTable Class
+#
+# A fixed number of slots grouped into buckets of two. The first slot of a
+# bucket keeps the deepest result (unless it is left over from an old search),
+# the second slot is always replaced.
+#
+class TranspositionTable(object):
+    def __init__(self, megabytes=32):
+        size = 2
+        while size * 2 * ENTRY_BYTES <= megabytes * 1024 * 1024:
+            size *= 2
+        self.size = size
+        self.mask = (size - 1) & ~1
+        self.entries = [None] * size
+        self.generation = 0
+
+    # Start a new search, so entries from previous searches become easier to replace
+    def newSearch(self):
+        self.generation += 1
+
+    # Throw away everything
+    def clear(self):
+        self.entries = [None] * self.size
+
+    # Return the (key, depth, bound, score, moveIndex, generation) entry for the key, or None
+    def probe(self, key):
+        index = key & self.mask
+        entry = self.entries[index]
+        if entry is not None and entry[0] == key:
+            return entry
+        entry = self.entries[index + 1]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    # Store the result of searching a position
+    def store(self, key, depth, bound, score, moveIndex):
+        index = key & self.mask
+        current = self.entries[index]
+        if current is None or current[0] == key or current[5] != self.generation or depth >= current[1]:
+            self.entries[index] = (key, depth, bound, score, moveIndex, self.generation)
+        else:
+            self.entries[index + 1] = (key, depth, bound, score, moveIndex, self.generation)
+
+#
+# Engine Class
+#
+class Engine(object):
+    def __init__(self, timeLimit=1.0, maxDepth=64, tableSize=32, table=None, evaluator=None, book=None, bookMinGames=10):
+        self.timeLimit = timeLimit
+        self.maxDepth = maxDepth
+        self.table = table if table is not None else TranspositionTable(tableSize)
+        # Scores quiet positions for the player to move (see evaluation.makeEvaluate for tuned weights)
+        self.evaluate = evaluator or evaluate
+        # Opening book (see openingBook.py) whose moves are played without
+        # searching, if they've been played in at least bookMinGames games
+        self.book = book
+        self.bookMinGames = bookMinGames
+
+        # Statistics about the last search
+        self.nodes = 0
+        self.depth = 0
+        self.score = 0
+        self.elapsed = 0.0
+
+    # Return the best move found for the player to move in the time available,
+    # or None if there are no legal moves
+    def search(self, position):
+        self.startSearch()
+        moves = cachedLegalMoves(position)
+        if not moves:
+            return None
+        bestMove = moves[0]
+        bookMove = self.book.getMove(position, self.bookMinGames) if self.book is not None and len(moves) > 1 else None
+        if bookMove is not None:
+            bestMove = bookMove
+        elif len(moves) > 1:
+            key = getHash(position)
+            try:
+                for depth in range(1, self.maxDepth + 1):
+                    iterationStart = time.time()
+                    score = self.negamax(position, key, depth, -INFINITY, INFINITY, 0)
+                    entry = self.table.probe(key)
+                    if entry is not None and entry[4] is not None:
+                        bestMove = moves[entry[4]]
+                    self.depth = depth
+                    self.score = score
+                    if abs(score) > WIN - 1000:
+                        break
+
+                    # Stop if even the cheapest next iteration couldn't finish in time.
+                    # Starting one that might is worth it: if it runs out of time the
+                    # move is still this iteration's, found within the time limit.
+                    now = time.time()
+                    if now - self.startTime + (now - iterationStart) * MIN_GROWTH > self.timeLimit:
+                        break
+            except SearchTimeout:
+                pass
+        self.elapsed = time.time() - self.startTime
+        return bestMove
+
+    # Release anything the engine holds on to. A single process engine has nothing to release.
+    def close(self):
+        pass
+
+    # Reset the clock and the statistics and move ordering of the last search
+    def startSearch(self):
+        self.startTime = time.time()
+        self.deadline = self.startTime + self.timeLimit
+        self.nodes = 0
+        self.nextClockCheck = NODES_PER_CLOCK_CHECK
+        self.depth = 0
+        self.score = 0
+        self.killers = [[None, None] for ply in range(self.maxDepth + 64)]
+        self.history = [0] * (32*32)
+        self.table.newSearch()
+
+    # Whether the search has to stop now
+    def isOutOfTime(self):
+        return time.time() > self.deadline
+
+    # Order moves to search the likely best ones first
+    def orderMoves(self, moves, ttMoveIndex, ply):
+        killers = self.killers[ply]
+        history = self.history
+        scored = []
+        for index, move in enumerate(moves):
+            if index == ttMoveIndex:
+                priority = 1 << 40
+            elif move == killers[0] or move == killers[1]:
+                priority = 1 << 30
+            else:
+                priority = history[move.path[0]*32 + move.path[-1]]
+            scored.append((priority, index))
+        scored.sort(reverse=True)
+        return scored
+
+    # Score a position at the end of the search: its evaluation, or a loss if
+    # the player to move can't move. None if it has captures to play out first.
+    def evaluateLeaf(self, position, ply):
+        if position.player is Player.ONE:
+            own, opponents, forward = position.white, position.yellow, DOWN
+        else:
+            own, opponents, forward = position.yellow, position.white, UP
+        empty = FULL & ~(own | opponents)
+        if getJumpers(own, position.kings, forward, opponents, empty):
+            return None
+        if getMovers(own, position.kings, forward, empty):
+            return self.evaluate(position)
+        return -WIN + ply
+
+    # Negamax search with alpha-beta pruning. Returns the score from the point of view of the player to move.
+    def negamax(self, position, key, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes >= self.nextClockCheck:
+            self.nextClockCheck = self.nodes + NODES_PER_CLOCK_CHECK
+            if self.isOutOfTime():
+                raise SearchTimeout()
+
+        # At the end of the search keep going while there are captures to make
+        if depth <= 0:
+            score = self.evaluateLeaf(position, ply)
+            if score is not None:
+                return score
+            depth = 0
+
+        moves = cachedLegalMoves(position)
+        if not moves:
+            return -WIN + ply
+
+        originalAlpha = alpha
+        ttMoveIndex = None
+        entry = self.table.probe(key)
+        if entry is not None:
+            ttMoveIndex = entry[4]
+            if entry[1] >= depth:
+                score = scoreFromTable(entry[3], ply)
+                if entry[2] == EXACT:
+                    return score
+                if entry[2] == LOWER and score > alpha:
+                    alpha = score
+                elif entry[2] == UPPER and score < beta:
+                    beta = score
+                if alpha >= beta:
+                    return score
+
+        bestScore = -INFINITY
+        bestIndex = None
+        searched = 0
+        for priority, index in self.orderMoves(moves, ttMoveIndex, ply):
+            move = moves[index]
+            child = applyMove(position, move)
+            # A quiet position at the end of the search is scored here rather
+            # than with a call to negamax, as most positions searched are these
+            score = self.evaluateLeaf(child, ply + 1) if depth <= 1 else None
+            if score is not None:
+                self.nodes += 1
+                score = -score
+            elif searched == 0:
+                childKey = getHashAfterMove(key, position, move, child)
+                score = -self.negamax(child, childKey, depth - 1, -beta, -alpha, ply + 1)
+            else:
+                childKey = getHashAfterMove(key, position, move, child)
+                # Principal variation search: prove the move is no better with a null window first,
+                # and for late quiet moves try that with less depth to begin with
+                newDepth = depth - 1
+                if searched >= LATE_MOVES and depth >= REDUCTION_DEPTH and not move.captures and priority < (1 << 30):
+                    newDepth -= 1
+                score = -self.negamax(child, childKey, newDepth, -alpha - 1, -alpha, ply + 1)
+                if score > alpha and newDepth < depth - 1:
+                    score = -self.negamax(child, childKey, depth - 1, -alpha - 1, -alpha, ply + 1)
+                if alpha < score < beta:
+                    score = -self.negamax(child, childKey, depth - 1, -beta, -score, ply + 1)
+            searched += 1
+            if score > bestScore:
+                bestScore = score
+                bestIndex = index
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        if not move.captures:
+                            self.addKiller(move, ply)
+                            self.history[move.path[0]*32 + move.path[-1]] += depth * depth
+                        break
+
+        if bestScore <= originalAlpha:
+            bound = UPPER
+        elif bestScore >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.table.store(key, depth, bound, scoreToTable(bestScore, ply), bestIndex)
+        return bestScore
+
+    # Remember a quiet move that caused a cutoff at this ply
+    def addKiller(self, move, ply):
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
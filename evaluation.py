@@ -0,0 +1,307 @@
+#!/usr/local/bin/python3
+#
+# Tunable evaluation
+#
+# A position's score is a weighted sum of features, each counted for white
+# minus the same for yellow:
+#
+#   men, kings        material
+#   back rank         men still on their own back row
+#   mobility          quiet moves available (as if it were that side's turn)
+#   men / king table  a weight for each square, seen from the side's own end
+#                     of the board (yellow's squares are turned around)
+#
+# Features and scores are worked out with NumPy for whole arrays of positions
+# at once. The default weights give exactly engine.evaluate's scores.
+#
+# The tuner fits the weights to the results of recorded games (Texel's
+# method): it minimises the squared difference between each position's result
+# for white (1, 0.5 or 0) and sigmoid(score / scale), with mini-batch Adam.
+#
+#   python3 evaluation.py tune results.txt games.pdn --output weights.json
+#   python3 evaluation.py check 100000
+#
+
+import sys
+import json
+import time
+import random
+import argparse
+import numpy as np
+from rules import *
+import engine
+
+# Where each term's weights are in the weight vector
+MEN = 0
+KINGS = 1
+BACK_RANK = 2
+MOBILITY = 3
+MEN_TABLE = slice(4, 36)
+KING_TABLE = slice(36, 68)
+NUM_FEATURES = 68
+
+# The weight vector written as a dict, for saving
+WEIGHT_NAMES = [("men", MEN), ("kings", KINGS), ("backRank", BACK_RANK), ("mobility", MOBILITY),
+                ("menTable", MEN_TABLE), ("kingTable", KING_TABLE)]
+
+SQUARE_SHIFTS = np.arange(32, dtype=np.int64)
+
+#
+# Weights
+#
+
+# Weights that score positions the same as engine.evaluate
+def getDefaultWeights():
+    weights = np.zeros(NUM_FEATURES)
+    weights[MEN] = engine.MAN_VALUE
+    weights[KINGS] = engine.KING_VALUE
+    weights[BACK_RANK] = 4
+    center = [3.0 if engine.CENTER >> square & 1 else 0.0 for square in range(32)]
+    advanced = [2.0 if engine.WHITE_ADVANCED >> square & 1 else 0.0 for square in range(32)]
+    weights[MEN_TABLE] = np.add(center, advanced)
+    weights[KING_TABLE] = center
+    return weights
+
+def saveWeights(weights, path, scale=None):
+    data = dict((name, np.atleast_1d(weights[index]).tolist() if isinstance(index, slice) else float(weights[index]))
+                for name, index in WEIGHT_NAMES)
+    if scale is not None:
+        data["scale"] = scale
+    with open(path, "w") as output:
+        json.dump(data, output, indent=1)
+
+def loadWeights(path):
+    with open(path) as data:
+        data = json.load(data)
+    weights = getDefaultWeights()
+    for name, index in WEIGHT_NAMES:
+        if name in data:
+            weights[index] = data[name]
+    return weights
+
+#
+# Batched evaluation
+#
+
+# Number of set bits in each bitboard of an array
+def countBits(bitboards):
+    return np.unpackbits(bitboards.astype("<u4").view(np.uint8).reshape(-1, 4), axis=1).sum(axis=1, dtype=np.int64).reshape(bitboards.shape)
+
+# Quiet moves available to a side's pieces
+def countMoves(pieces, kings, forward, empty):
+    moves = 0
+    for direction in ALL_DIRECTIONS:
+        movable = pieces if direction in forward else pieces & kings
+        moves = moves + countBits(step(movable, direction) & empty)
+    return moves
+
+# (N, NUM_FEATURES) features of arrays of white, yellow and kings bitboards
+def getFeatures(white, yellow, kings):
+    white = np.asarray(white, dtype=np.int64)
+    yellow = np.asarray(yellow, dtype=np.int64)
+    kings = np.asarray(kings, dtype=np.int64)
+    whiteMen = white & ~kings
+    yellowMen = yellow & ~kings
+    empty = FULL & ~(white | yellow)
+
+    features = np.empty((len(white), NUM_FEATURES), dtype=np.float32)
+    features[:, MEN] = countBits(whiteMen) - countBits(yellowMen)
+    features[:, KINGS] = countBits(white & kings) - countBits(yellow & kings)
+    features[:, BACK_RANK] = countBits(whiteMen & ROWS[0]) - countBits(yellowMen & ROWS[7])
+    features[:, MOBILITY] = countMoves(white, kings, DOWN, empty) - countMoves(yellow, kings, UP, empty)
+
+    # Yellow's square s is white's square 31 - s
+    def unpack(bitboards):
+        return (bitboards[:, np.newaxis] >> SQUARE_SHIFTS) & 1
+    features[:, MEN_TABLE] = unpack(whiteMen) - unpack(yellowMen)[:, ::-1]
+    features[:, KING_TABLE] = unpack(white & kings) - unpack(yellow & kings)[:, ::-1]
+    return features
+
+# Scores for white of arrays of positions
+def evaluateBatch(weights, white, yellow, kings):
+    return getFeatures(white, yellow, kings) @ weights
+
+# Arrays of (white, yellow, kings, isPlayerOne) for a list of positions
+def positionsToArrays(positions):
+    white = np.fromiter((position.white for position in positions), dtype=np.int64, count=len(positions))
+    yellow = np.fromiter((position.yellow for position in positions), dtype=np.int64, count=len(positions))
+    kings = np.fromiter((position.kings for position in positions), dtype=np.int64, count=len(positions))
+    isPlayerOne = np.fromiter((position.player is Player.ONE for position in positions), dtype=bool, count=len(positions))
+    return (white, yellow, kings, isPlayerOne)
+
+#
+# Single positions
+#
+
+# An evaluate(position) function for the engine using a set of weights.
+# Scores are from the point of view of the player to move, like engine.evaluate.
+def makeEvaluate(weights):
+    men, kingValue, backRank, mobility = (float(weights[index]) for index in (MEN, KINGS, BACK_RANK, MOBILITY))
+    whiteMenTable = [float(value) for value in weights[MEN_TABLE]]
+    whiteKingTable = [float(value) for value in weights[KING_TABLE]]
+    yellowMenTable = whiteMenTable[::-1]
+    yellowKingTable = whiteKingTable[::-1]
+
+    def evaluate(position):
+        white = position.white
+        yellow = position.yellow
+        kings = position.kings
+        whiteMen = white & ~kings
+        yellowMen = yellow & ~kings
+        score = (men * (popCount(whiteMen) - popCount(yellowMen)) + kingValue * (popCount(white & kings) - popCount(yellow & kings)) +
+                 backRank * (popCount(whiteMen & ROWS[0]) - popCount(yellowMen & ROWS[7])))
+        if mobility:
+            empty = FULL & ~(white | yellow)
+            for direction in ALL_DIRECTIONS:
+                score += mobility * (popCount(step(white if direction in DOWN else white & kings, direction) & empty) -
+                                     popCount(step(yellow if direction in UP else yellow & kings, direction) & empty))
+        for square in iterSquares(white):
+            score += (whiteKingTable if kings >> square & 1 else whiteMenTable)[square]
+        for square in iterSquares(yellow):
+            score -= (yellowKingTable if kings >> square & 1 else yellowMenTable)[square]
+        return score if position.player is Player.ONE else -score
+    return evaluate
+
+#
+# Tuning
+#
+
+# Positions from recorded games, labelled with the game's result for white.
+# The opening plies are left out, and so are positions with a capture to make,
+# since their score is about to change. Returns (white, yellow, kings, results) arrays.
+def loadDataset(paths, maxPositions=None, skipPlies=6):
+    from pdn import readRecordedGames, WHITE_SCORES
+    columns = ([], [], [], [])
+    for start, moves, marker in readRecordedGames(paths):
+        score = WHITE_SCORES.get(marker)
+        if score is None: continue
+        position = start
+        for ply, move in enumerate(moves):
+            if ply >= skipPlies and not getJumpingPieces(position):
+                columns[0].append(position.white)
+                columns[1].append(position.yellow)
+                columns[2].append(position.kings)
+                columns[3].append(score)
+            position = applyMove(position, move)
+        if maxPositions is not None and len(columns[0]) >= maxPositions:
+            break
+    white, yellow, kings = (np.array(column[:maxPositions], dtype=np.int64) for column in columns[:3])
+    return (white, yellow, kings, np.array(columns[3][:maxPositions], dtype=np.float32))
+
+def sigmoid(values):
+    return 1.0 / (1.0 + np.exp(-values))
+
+# Mean squared error of the predicted results
+def getError(features, results, weights, scale):
+    return float(np.mean((sigmoid(features @ weights / scale) - results) ** 2))
+
+# The scale that best turns the weights' scores into results
+def fitScale(features, results, weights, low=10.0, high=2000.0):
+    # Golden section search on the error, which has one minimum
+    ratio = (5 ** 0.5 - 1) / 2
+    for iteration in range(40):
+        a = high - ratio * (high - low)
+        b = low + ratio * (high - low)
+        if getError(features, results, weights, a) < getError(features, results, weights, b):
+            high = b
+        else:
+            low = a
+    return (low + high) / 2
+
+# Fit the weights to the results with mini-batch Adam. The square tables are
+# pulled gently towards zero (regularization) so squares that rarely have a
+# piece on them don't get extreme weights. Returns the new weights.
+def tune(features, results, weights, scale, epochs=20, batchSize=16384, learningRate=1.0, regularization=1e-4, seed=0, log=print):
+    weights = weights.astype(np.float64).copy()
+    penalty = np.zeros(NUM_FEATURES)
+    penalty[MEN_TABLE] = regularization
+    penalty[KING_TABLE] = regularization
+    generator = np.random.default_rng(seed)
+    first = np.zeros(NUM_FEATURES)
+    second = np.zeros(NUM_FEATURES)
+    beta1, beta2 = 0.9, 0.999
+    steps = 0
+
+    for epoch in range(epochs):
+        startTime = time.time()
+        order = generator.permutation(len(results))
+        for start in range(0, len(results), batchSize):
+            batch = order[start:start + batchSize]
+            batchFeatures = features[batch].astype(np.float64)
+            predicted = sigmoid(batchFeatures @ weights / scale)
+            errors = (predicted - results[batch]) * predicted * (1.0 - predicted) * (2.0 / scale)
+            gradient = batchFeatures.T @ errors / len(batch) + penalty * weights
+
+            steps += 1
+            first = beta1 * first + (1 - beta1) * gradient
+            second = beta2 * second + (1 - beta2) * gradient * gradient
+            weights -= learningRate * (first / (1 - beta1 ** steps)) / (np.sqrt(second / (1 - beta2 ** steps)) + 1e-12)
+        elapsed = time.time() - startTime
+        log("epoch %d: error %.6f (%.2fs, %.0f positions/sec)" %
+            (epoch + 1, getError(features, results, weights, scale), elapsed, len(results) / max(elapsed, 1e-9)))
+    return weights
+
+#
+# Command line
+#
+
+# Check the batched evaluation and makeEvaluate against engine.evaluate on random game positions
+def check(numPositions, seed=0):
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < numPositions:
+        position = startingPosition()
+        for ply in range(rng.randrange(0, 120)):
+            moves = cachedLegalMoves(position)
+            if not moves: break
+            position = applyMove(position, rng.choice(moves))
+        positions.append(position)
+
+    white, yellow, kings, isPlayerOne = positionsToArrays(positions)
+    weights = getDefaultWeights()
+    startTime = time.time()
+    scores = evaluateBatch(weights, white, yellow, kings)
+    elapsed = time.time() - startTime
+    scores = np.where(isPlayerOne, scores, -scores)
+    evaluate = makeEvaluate(weights)
+    for position, score in zip(positions, scores):
+        if not (engine.evaluate(position) == score == evaluate(position)):
+            raise AssertionError("Evaluations disagree for %r" % (position,))
+    print("%d positions agree (%.0f positions/sec batched)" % (numPositions, numPositions / max(elapsed, 1e-9)))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tune the evaluation weights on recorded games.")
+    subcommands = parser.add_subparsers(dest="command")
+    tuneParser = subcommands.add_parser("tune", help="fit the weights to game results")
+    tuneParser.add_argument("files", nargs="+", help="simulate.py results files or .pdn files")
+    tuneParser.add_argument("--output", default="weights.json", help="file to write the weights to (default: weights.json)")
+    tuneParser.add_argument("--weights", help="weights to start from (default: engine.evaluate's)")
+    tuneParser.add_argument("--max-positions", type=int, help="use at most this many positions")
+    tuneParser.add_argument("--epochs", type=int, default=20, help="passes over the positions (default: 20)")
+    tuneParser.add_argument("--batch", type=int, default=16384, help="positions per mini-batch (default: 16384)")
+    tuneParser.add_argument("--rate", type=float, default=1.0, help="learning rate (default: 1.0)")
+    checkParser = subcommands.add_parser("check", help="check the batched evaluation against engine.evaluate")
+    checkParser.add_argument("positions", type=int, nargs="?", default=10000)
+    args = parser.parse_args(argv)
+
+    if args.command == "tune":
+        startTime = time.time()
+        white, yellow, kings, results = loadDataset(args.files, args.max_positions)
+        print("loaded %d positions in %.1fs" % (len(results), time.time() - startTime))
+        startTime = time.time()
+        features = getFeatures(white, yellow, kings)
+        print("features in %.2fs" % (time.time() - startTime))
+
+        weights = loadWeights(args.weights) if args.weights else getDefaultWeights()
+        scale = fitScale(features, results, weights)
+        print("scale %.1f, error %.6f" % (scale, getError(features, results, weights, scale)))
+        weights = tune(features, results, weights, scale, args.epochs, args.batch, args.rate)
+        saveWeights(weights, args.output, scale)
+        print("wrote %s" % args.output)
+    elif args.command == "check":
+        check(args.positions)
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
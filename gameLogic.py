@@ -1,74 +1,77 @@
-import pygame
 from board import *
+from moveCache import MoveCache
+from history import GameHistory
 
 #
 # Game class
 #
-# This will handle the core checkers game logic
+# This connects the checkers rules (see rules.py) to the board the players
+# drag pieces around on. A multi-jump is played one hop at a time, but it is
+# only applied to the position once a complete legal move has been made.
+# Moves are recorded in a GameHistory so they can be taken back and replayed.
 #
 class Game(object):
     def __init__(self, board):
         self.board = board
-        self.currentPlayer = Player.TWO
+        self.currentPlayer = board.position.player
         self.selectablePieces = []
+        self.selectableSquares = set()
         self.visibleLegalMoves = []
 
+        # First steps of every piece's moves, updated as the position changes,
+        # and the (cache version, dragged piece) the selectable pieces were found for
+        self.moveCache = MoveCache(board.position)
+        self.selectableKey = None
+
+        # Moves played so far
+        self.history = GameHistory(board.position)
+
+        # Squares the piece being moved has visited so far, and the
+        # complete legal moves that are still consistent with them
+        self.movePath = []
+        self.candidateMoves = []
+
+        # Computer opponent, if there is one. It searches in the background
+        # (see backgroundSearch.py), so these are the request it's working on,
+        # the move it found and the reply it expects.
+        self.computerPlayer = None
+        self.searcher = None
+        self.searchRequest = None
+        self.computerMove = None
+        self.expectedReply = None
+
+    # Let the computer play for one of the players, searching with a BackgroundSearch
+    def setComputerPlayer(self, player, searcher):
+        self.computerPlayer = player
+        self.searcher = searcher
+
     # Returns whether or not trying to move a piece to a specific location is a legal move
     def isLegalMove(self, piece, targetPos):
         if targetPos is None: return False
         if piece is None or piece[2] is Player.NONE: return False
+        return targetPos in self.getLegalMoves(piece)
 
-        targetX,targetY = targetPos
-        currX,currY = (piece[0], piece[1])
-
-        allLegalMoves = self.getLegalMoves(piece)
-        return targetPos in allLegalMoves
-
-    # Returns all possible legal moves for a given piece
+    # Returns all possible legal moves for a given piece.
+    # Part way through a multi-jump these are the next hops the piece can take.
     def getLegalMoves(self, pieceData):
         (x,y,piece) = pieceData
-        legalMoves = []
-
-        # Get compulsory hop options
-        legalMoves += self.getHops(pieceData)
-
-        # Append empty spots if not hops are available
-        if len(legalMoves) is 0:
-            if isPlayerOne(piece) or isKing(piece):
-                if x-1 >= 0 and y+1 < 8:
-                    if self.board.get(x-1, y+1) is Player.NONE:
-                        legalMoves.append((x-1,y+1))
-                if x+1 < 8 and y+1 < 8:
-                    if self.board.get(x+1, y+1) is Player.NONE:
-                        legalMoves.append((x+1,y+1))
-            if isPlayerTwo(piece) or isKing(piece):
-                if x-1 >= 0 and y-1 >= 0:
-                    if self.board.get(x-1, y-1) is Player.NONE:
-                        legalMoves.append((x-1,y-1))
-                if x+1 < 8 and y-1 >= 0:
-                    if self.board.get(x+1, y-1) is Player.NONE:
-                        legalMoves.append((x+1,y-1))
-        return legalMoves
+        square = squareFromIndex(x,y)
+        if not self.movePath or self.movePath[-1] != square:
+            self.moveCache.setPosition(self.board.position)
+            return [indexFromSquare(target) for target in self.moveCache.getLegalTargets(square)]
+
+        depth = len(self.movePath)
+        legalTargets = []
+        for move in self.candidateMoves:
+            target = indexFromSquare(move.path[depth])
+            if target not in legalTargets:
+                legalTargets.append(target)
+        return legalTargets
 
     # Get all immediate hop moves (capture moves)
     def getHops(self, pieceData):
         (x,y,piece) = pieceData
-        legalMoves = []
-        if isPlayerOne(piece) or isKing(piece):
-            if x-2 >= 0 and y+2 < 8:
-                if areOpponents(piece, self.board.get(x-1, y+1)) and not (x-1, y+1) in self.board.choppingBlock and selfOrNone(piece, self.board.get(x-2, y+2)):
-                    legalMoves.append((x-2,y+2))
-            if x+2 < 8 and y+2 < 8:
-                if areOpponents(piece, self.board.get(x+1, y+1)) and not (x+1, y+1) in self.board.choppingBlock and selfOrNone(piece, self.board.get(x+2, y+2)):
-                    legalMoves.append((x+2,y+2))
-        if isPlayerTwo(piece) or isKing(piece):
-            if x-2 >= 0 and y-2 >= 0:
-                if areOpponents(piece, self.board.get(x-1, y-1)) and not (x-1, y-1) in self.board.choppingBlock and selfOrNone(piece, self.board.get(x-2, y-2)):
-                    legalMoves.append((x-2,y-2))
-            if x+2 < 8 and y-2 >= 0:
-                if areOpponents(piece, self.board.get(x+1, y-1)) and not (x+1, y-1) in self.board.choppingBlock and selfOrNone(piece, self.board.get(x+2, y-2)):
-                    legalMoves.append((x+2,y-2))
-        return legalMoves
+        return [(newX,newY) for newX,newY in self.getLegalMoves(pieceData) if abs(x-newX) == 2]
 
     # Progress the currently selected piece to the new location
     # If this is a capture move, we may need to do more captures
@@ -76,95 +79,162 @@ class Game(object):
         (origX,origY,piece), (x,y) = pieceData
         (newX,newY) = newPosition
 
-        # If the move is a capture move...
-        if abs(x-newX) == 2:
-            # Add the captured piece to the chopping block
-            chopX = x+1
-            chopY = y+1
-            if newX < x:
-                chopX = x-1
-            if newY < y:
-                chopY = y-1
-            self.board.choppingBlock.append((chopX, chopY))
-
-            # Check for more jumps to take
-            moreHops = self.getHops((newX,newY,piece))
-            if not moreHops:
-                self.endMove(pieceData[0], newPosition)
-            else:
-                # Display new legal moves (additional hops)
-                self.visibleLegalMoves = moreHops
-                # Add this move to the list of hops this piece has already taken
-                self.board.currentMoveSequence.insert(-1, self.board.getPiecePositionFromIndex(newX,newY))
-        else:
-            # The move isn't a capture move, so end the move
-            self.endMove(pieceData[0], newPosition)
+        # Narrow down the legal moves to the ones following this path
+        if not self.movePath:
+            origin = squareFromIndex(origX, origY)
+            self.movePath = [origin]
+            self.candidateMoves = [move for move in cachedLegalMoves(self.board.position) if move.path[0] == origin]
+        self.movePath.append(squareFromIndex(newX, newY))
+        path = tuple(self.movePath)
+        self.candidateMoves = [move for move in self.candidateMoves if move.path[:len(path)] == path]
 
-    # Finish the current move.
-    def endMove(self, pieceData, newPosition):
-        (x,y,piece) = pieceData
-        (newX,newY) = newPosition
+        # If the move is a capture move, add the captured piece to the chopping block
+        if abs(x-newX) == 2:
+            self.board.choppingBlock.append(((x+newX)//2, (y+newY)//2))
 
+        finishedMoves = [move for move in self.candidateMoves if move.path == path]
+        if finishedMoves:
+            self.endMove(finishedMoves[0])
+        else:
+            # Display new legal moves (additional hops)
+            self.visibleLegalMoves = self.getLegalMoves((newX,newY,piece))
+            # Add this move to the list of hops this piece has already taken
+            self.board.currentMoveSequence.insert(-1, self.board.getPiecePositionFromIndex(newX,newY))
+
+    # Abandon a move part way through (the piece snaps back to where it started)
+    def cancelMove(self):
+        self.movePath = []
+        self.candidateMoves = []
         self.board.currentMoveSequence = []
-
-        # Destroy jumped pieces
-        for chopX,chopY in self.board.choppingBlock:
-            self.board.board[chopY][chopX] = Player.NONE
         self.board.choppingBlock = []
 
-        # Old spot is set to empty
-        self.board.board[y][x] = Player.NONE
+    # Finish the current move.
+    def endMove(self, move):
+        self.cancelMove()
 
-        # Is the new spot a crowned piece?
-        newPiece = piece
-        if self.shouldPromoteToKing(newY,piece):
-            newPiece = getKing(piece)
+        # Someone else moved for the computer: its search is for a position that's gone
+        if self.computerPlayer is self.currentPlayer and self.searchRequest is not None:
+            self.stopComputer()
 
-        # Set the new spot for the piece
-        self.board.board[newY][newX] = newPiece
+        # Play the move (this also destroys the jumped pieces and crowns kings)
+        self.history.makeMove(move)
+        self.showPosition(move)
+        (newX,newY) = indexFromSquare(move.path[-1])
 
         # Adjust the draggingPiece object so we can continue to animate it into its new location
-        self.board.draggingPiece = ((newX, newY, piece), self.board.draggingPiece[1])
-        self.board.draggingPieceTarget = self.board.getPiecePositionFromIndex(newX, newY)
+        if self.board.draggingPiece is not None:
+            self.board.draggingPiece = ((newX, newY, self.board.get(newX, newY)), self.board.draggingPiece[1])
+            self.board.draggingPieceTarget = self.board.getPiecePositionFromIndex(newX, newY)
+
+    # Show the history's current position after the move was played or taken back
+    def showPosition(self, move):
+        self.board.position = self.history.position
+        self.moveCache.setPosition(self.board.position, (1 << move.path[0]) | (1 << move.path[-1]) | move.captures)
 
         # Change players
-        self.currentPlayer = getOpponent(self.currentPlayer)
+        self.currentPlayer = self.board.position.player
 
-        # See if the game is done
+        # See if the game is done (or not any more, after a take back)
+        self.board.winner = None
         self.testForGameOver()
 
+    # Stop animating a piece that is snapping into place. Returns False if a
+    # piece is still held by the mouse, which can't be put down like this.
+    def putDownPiece(self):
+        if self.board.draggingPiece is None: return True
+        if self.board.draggingPieceTarget is None: return False
+        self.board.draggingPiece = None
+        self.board.draggingPieceTarget = None
+        return True
+
+    # Take back the last move. Against the computer, moves are taken back
+    # until it's the person's turn again. Returns whether anything changed.
+    def undoMove(self):
+        if not self.history.canUndo() or not self.putDownPiece(): return False
+        self.stopComputer()
+        while True:
+            self.showPosition(self.history.unmakeMove())
+            if self.computerPlayer is not self.currentPlayer or not self.history.canUndo():
+                return True
+
+    # Play the last move taken back again, and the computer's reply to it.
+    # Returns whether anything changed.
+    def redoMove(self):
+        if not self.history.canRedo() or not self.putDownPiece(): return False
+        self.stopComputer()
+        while True:
+            self.showPosition(self.history.redoMove())
+            if self.computerPlayer is not self.currentPlayer or not self.history.canRedo():
+                return True
+
     # End the game if necessary
     def testForGameOver(self):
-        if self.board.getNumberOfPlayer(Player.ONE) == 0:
-            self.gameOver(Player.TWO)
-        if self.board.getNumberOfPlayer(Player.TWO) == 0:
-            self.gameOver(Player.ONE)
+        winner = result(self.board.position)
+        if winner is not None:
+            self.gameOver(winner)
 
     # Ends the game
     def gameOver(self, winner):
+        self.stopComputer()
         self.board.gameOver(winner)
 
     # Whether or not this piece should be crowned
     def shouldPromoteToKing(self, row, piece):
-        if isPlayerOne(piece) and row == 7:
-            return True
-        if isPlayerTwo(piece) and row == 0:
-            return True
-        return False
+        return shouldPromoteToKing(row, piece)
+
+    # Abandon whatever the computer is thinking about
+    def stopComputer(self):
+        if self.searcher is not None:
+            self.searcher.cancel()
+        self.searchRequest = None
+        self.computerMove = None
+
+    # Whether the computer has something to do in the next update: start
+    # thinking, or play the move it found
+    def isComputerWaiting(self):
+        if self.computerPlayer is not self.currentPlayer or self.board.winner is not None:
+            return False
+        return self.searchRequest is None or self.computerMove is not None
+
+    # A background search finished. Keep its move if it's still wanted.
+    def handleSearchResult(self, searchResult):
+        if searchResult.request != self.searchRequest or self.computerMove is not None: return
+        if searchResult.position != self.board.position or searchResult.move is None: return
+        self.computerMove = searchResult.move
+        self.expectedReply = searchResult.reply
+
+    # Have the computer play its move, animating the piece from where it started
+    def playComputerMove(self):
+        move = self.computerMove
+        self.computerMove = None
+        self.searchRequest = None
+        (x,y) = indexFromSquare(move.path[0])
+        self.board.draggingPiece = ((x, y, self.board.get(x, y)), self.board.getPiecePositionFromIndex(x, y))
+        self.endMove(move)
+
+        # Think about the reply the person is expected to make while they make it
+        if self.board.winner is None and self.expectedReply is not None:
+            self.searcher.ponder(applyMove(self.board.position, self.expectedReply))
 
     # Main update loop called each frame
     def update(self):
-        # Get Selectable Pieces
-        self.selectablePieces = []
-        if self.board.draggingPiece is None:
-            for pieceData in self.board.getPieceData(self.currentPlayer):
-                hops = self.getHops(pieceData)
-                if len(hops) is not 0:
-                    self.selectablePieces.append(pieceData)
-            if not self.selectablePieces:
-                for pieceData in self.board.getPieceData(self.currentPlayer):
-                    moves = self.getLegalMoves(pieceData)
-                    if len(moves) is not 0:
-                        self.selectablePieces.append(pieceData)
-        else:
-            self.selectablePieces.append(self.board.draggingPiece[0])
+        # Computer's turn. It thinks in the background, and its move is played
+        # once it's found and nothing is moving on the board.
+        if self.computerPlayer is self.currentPlayer and self.board.winner is None:
+            if self.searchRequest is None:
+                self.searchRequest = self.searcher.search(self.board.position)
+            elif self.computerMove is not None and self.board.draggingPiece is None:
+                self.playComputerMove()
+
+        # Get Selectable Pieces. These only change when the position does
+        # or a piece is picked up / put down.
+        self.moveCache.setPosition(self.board.position)
+        draggedPiece = self.board.draggingPiece[0] if self.board.draggingPiece is not None else None
+        selectableKey = (self.moveCache.version, draggedPiece)
+        if selectableKey != self.selectableKey:
+            self.selectableKey = selectableKey
+            if draggedPiece is None:
+                self.selectablePieces = self.board.getPieceDataFromBitboard(self.moveCache.getSelectable())
+            else:
+                self.selectablePieces = [draggedPiece]
+            self.selectableSquares = set((x,y) for x,y,piece in self.selectablePieces)
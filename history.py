@@ -0,0 +1,60 @@
+from rules import *
+
+#
+# GameHistory Class
+#
+# The moves played in a game, kept as a stack of Undo records (see rules.py)
+# so moves can be taken back and replayed without storing every position.
+# Moves that have been taken back are kept for redo until a different move is
+# played.
+#
+class GameHistory(object):
+    def __init__(self, position=None):
+        self.startPosition = position if position is not None else startingPosition()
+        self.position = self.startPosition
+
+        # (move, undo record) for each move played, and the moves taken back
+        # most recent last
+        self.played = []
+        self.undone = []
+
+    # Play a move
+    def makeMove(self, move):
+        self.position, undo = makeMove(self.position, move)
+        self.played.append((move, undo))
+        if self.undone and self.undone[-1] == move:
+            self.undone.pop()
+        else:
+            self.undone = []
+
+    # Take back the last move. Returns the move, or None if there wasn't one.
+    def unmakeMove(self):
+        if not self.played: return None
+        move, undo = self.played.pop()
+        self.position = unmakeMove(self.position, undo)
+        self.undone.append(move)
+        return move
+
+    # Play the last move taken back again. Returns the move, or None if there wasn't one.
+    def redoMove(self):
+        if not self.undone: return None
+        move = self.undone[-1]
+        self.makeMove(move)
+        return move
+
+    def canUndo(self):
+        return len(self.played) > 0
+
+    def canRedo(self):
+        return len(self.undone) > 0
+
+    # The moves played so far, in order
+    def getMoves(self):
+        return [move for move, undo in self.played]
+
+    # Every position of the game so far, starting with the start position
+    def getPositions(self):
+        positions = [self.startPosition]
+        for move, undo in self.played:
+            positions.append(applyMove(positions[-1], move))
+        return positions
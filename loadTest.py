@@ -0,0 +1,153 @@
+#!/usr/local/bin/python3
+#
+# Load test for server.py
+#
+# Connects lots of simulated players to a game server. Each one joins a game,
+# plays random legal moves whenever it's their turn and joins another game
+# when one ends. Reports the moves per second, the time from sending a move
+# to seeing the server's new state, and the server's own statistics.
+# The players and the server share the machine's cores, so on a small machine
+# the round trip time is mostly waiting for the players' own work.
+#
+#   python3 loadTest.py --clients 2000 --games 3 --start-server
+#
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+from rules import *
+from pdn import parseFen, formatMove
+
+#
+# LoadStats Class
+#
+class LoadStats(object):
+    def __init__(self):
+        self.games = 0
+        self.moves = 0
+        self.errors = 0
+        self.latencies = []
+        # The server's statistics when it had the most games running
+        self.peakServerStats = None
+
+    # Latency (in milliseconds) at a percentile, 0-100
+    def getLatency(self, percentile):
+        if not self.latencies: return 0.0
+        latencies = sorted(self.latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * percentile / 100.0))
+        return latencies[index] * 1000.0
+
+async def sendMessage(writer, message):
+    writer.write((json.dumps(message) + "\n").encode())
+    await writer.drain()
+
+async def readMessage(reader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("server closed the connection")
+    return json.loads(line)
+
+# One simulated player. Plays numGames games, one after another, resigning
+# any game that lasts maxPlies plies.
+async def runClient(host, port, numGames, maxPlies, seed, stats):
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for gameNumber in range(numGames):
+            await sendMessage(writer, {"type": "join"})
+            game = None
+            color = None
+            moveSent = None
+            while True:
+                message = await readMessage(reader)
+                if message["type"] == "joined":
+                    game = message["game"]
+                    color = Player.TWO if message["color"] == "black" else Player.ONE
+                elif message["type"] == "error":
+                    stats.errors += 1
+                elif message["type"] == "state" and message["game"] == game:
+                    if moveSent is not None and message["last"] is not None:
+                        stats.latencies.append(time.time() - moveSent)
+                        moveSent = None
+                    if message["result"] is not None:
+                        stats.games += 1
+                        break
+                    position = parseFen(message["fen"])
+                    if message["started"] and position.player is color:
+                        if message["plies"] >= maxPlies:
+                            await sendMessage(writer, {"type": "resign", "game": game})
+                            continue
+                        moves = cachedLegalMoves(position)
+                        moveSent = time.time()
+                        stats.moves += 1
+                        await sendMessage(writer, {"type": "move", "game": game, "move": formatMove(rng.choice(moves))})
+    finally:
+        writer.close()
+
+# Ask the server for its statistics
+async def getServerStats(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    await sendMessage(writer, {"type": "stats"})
+    stats = await readMessage(reader)
+    writer.close()
+    return stats
+
+async def runLoadTest(host, port, numClients, numGames, maxPlies, seed):
+    stats = LoadStats()
+    startTime = time.time()
+    clients = [runClient(host, port, numGames, maxPlies, str((seed, client)), stats) for client in range(numClients)]
+
+    # Sample the server while the games are running
+    async def sample():
+        while True:
+            await asyncio.sleep(1.0)
+            serverStats = await getServerStats(host, port)
+            if stats.peakServerStats is None or serverStats["games"] >= stats.peakServerStats["games"]:
+                stats.peakServerStats = serverStats
+            print("%6.1fs: %d games, %d connections, %d moves" % (time.time() - startTime, serverStats["games"], serverStats["connections"], stats.moves))
+    sampler = asyncio.ensure_future(sample())
+    results = await asyncio.gather(*clients, return_exceptions=True)
+    sampler.cancel()
+    elapsed = time.time() - startTime
+
+    failures = [result for result in results if isinstance(result, Exception)]
+    serverStats = await getServerStats(host, port)
+    print("%d clients played %d games, %d moves in %.2fs (%.0f moves/sec)" % (numClients, stats.games, stats.moves, elapsed, stats.moves / elapsed))
+    print("move latency: p50 %.1f ms, p95 %.1f ms, p99 %.1f ms, max %.1f ms" %
+          (stats.getLatency(50), stats.getLatency(95), stats.getLatency(99), stats.getLatency(100)))
+    peak = stats.peakServerStats
+    if peak is not None and "maxRssMegabytes" in serverStats:
+        print("server: peak %d games at once, %.1f MB max RSS, %.0f us per move" %
+              (peak["games"], serverStats["maxRssMegabytes"], serverStats["microsecondsPerMove"]))
+    if stats.errors or failures:
+        print("%d errors, %d clients failed (first: %r)" % (stats.errors, len(failures), failures[0] if failures else None))
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the checkers game server.")
+    parser.add_argument("--host", default="127.0.0.1", help="server address (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="server port (default: 8765)")
+    parser.add_argument("--clients", type=int, default=1000, help="number of simulated players (default: 1000)")
+    parser.add_argument("--games", type=int, default=1, help="games each player plays (default: 1)")
+    parser.add_argument("--max-plies", type=int, default=200, help="resign games that last this many plies (default: 200)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    parser.add_argument("--start-server", action="store_true", help="run server.py in a separate process for the test")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.start_server:
+        server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py"), "--host", args.host, "--port", str(args.port)], stdout=subprocess.DEVNULL)
+        time.sleep(1.0)
+    try:
+        asyncio.run(runLoadTest(args.host, args.port, args.clients, args.games, args.max_plies, args.seed))
+    finally:
+        if server is not None:
+            server.terminate()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+from rules import *
+
+#
+# MoveCache Class
+#
+# Keeps the first step of every piece's moves (the squares it can hop to and
+# the squares it can step to) for a position, so they don't have to be worked
+# out again every frame. The cache has a version number that goes up each time
+# the position changes.
+#
+# When the cache is told which squares a move touched, only the pieces near
+# those squares are recomputed; everything else on the board is unaffected.
+#
+class MoveCache(object):
+    def __init__(self, position=None):
+        self.position = None
+        self.version = 0
+
+        # First hop / step targets of the piece on each square
+        self.hops = [()] * 32
+        self.steps = [()] * 32
+
+        # Bitboards of the pieces that have at least one hop / step
+        self.hopping = 0
+        self.stepping = 0
+
+        if position is not None:
+            self.setPosition(position)
+
+    # Move the cache on to a new position. touched is the bitboard of squares
+    # that changed since the cached position; without it everything is recomputed.
+    def setPosition(self, position, touched=None):
+        if position is self.position or position == self.position:
+            self.position = position
+            return
+
+        dirty = FULL
+        if touched is not None and self.position is not None:
+            dirty = 0
+            for square in iterSquares(touched):
+                dirty |= NEARBY[square]
+
+        self.position = position
+        self.version += 1
+        for square in iterSquares(dirty):
+            self.updateSquare(square)
+
+    # Recompute the moves of the piece on a square
+    def updateSquare(self, square):
+        position = self.position
+        bit = 1 << square
+        if position.white & bit:
+            own, opponents, forward = position.white, position.yellow, DOWN
+        elif position.yellow & bit:
+            own, opponents, forward = position.yellow, position.white, UP
+        else:
+            self.hops[square] = ()
+            self.steps[square] = ()
+            self.hopping &= ~bit
+            self.stepping &= ~bit
+            return
+
+        empty = FULL & ~(own | opponents)
+        hops = []
+        steps = []
+        for direction in getDirections(forward, position.kings & bit):
+            neighbour = NEIGHBOURS[direction][bit]
+            if neighbour & empty:
+                steps.append(neighbour.bit_length() - 1)
+            elif neighbour & opponents and JUMPS[direction][bit] & empty:
+                hops.append(JUMPS[direction][bit].bit_length() - 1)
+        self.hops[square] = tuple(hops)
+        self.steps[square] = tuple(steps)
+        self.hopping = (self.hopping | bit) if hops else (self.hopping & ~bit)
+        self.stepping = (self.stepping | bit) if steps else (self.stepping & ~bit)
+
+    # Bitboard of the pieces the player to move can start a legal move with
+    def getSelectable(self):
+        own = getSides(self.position)[0]
+        return (self.hopping & own) or (self.stepping & own)
+
+    # Squares the piece on a square can move to first. Captures are
+    # compulsory, so these are only steps if no piece of that side can hop.
+    def getLegalTargets(self, square):
+        own = getSides(self.position)[0]
+        if not own & (1 << square):
+            return ()
+        if self.hopping & own:
+            return self.hops[square]
+        return self.steps[square]
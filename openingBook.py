@@ -0,0 +1,190 @@
+#!/usr/local/bin/python3
+#
+# Opening book
+#
+# How often each move was played in each position of the first moves of lots
+# of games, and how well it scored, so the computer can answer well known
+# openings straight away instead of searching them.
+#
+# A book is one file of fixed size records sorted by the position's hash
+# (Position.hash), so it is memory mapped and searched with a binary search:
+# opening a book reads nothing and a lookup touches O(log n) records.
+#
+#   header  8 byte magic, record count (uint64)
+#   record  position hash (uint64), origin square, target square (uint8),
+#           captured squares (uint32 bitboard), games (uint32),
+#           points (uint32, 2 for a win and 1 for a draw for the player who moved)
+#
+# Books are built from PDN files and simulate.py results files, e.g. from a
+# large batch of self-play games:
+#
+#   python3 simulate.py 100000 --white engine --yellow engine --output selfplay.txt
+#   python3 openingBook.py build selfplay.txt archive.pdn --output book.bin
+#   python3 openingBook.py show book.bin
+#
+
+import os
+import math
+import mmap
+import time
+import struct
+import argparse
+from rules import *
+
+BOOK_MAGIC = b"CKBOOK1\0"
+HEADER = struct.Struct("<8sQ")
+RECORD = struct.Struct("<QBBIII")
+
+# Book moves played fewer times than this aren't played by default
+MIN_GAMES = 10
+
+# Lowest average score a move is likely to have (the lower end of the 95%
+# Wilson interval) given its average score over some games. A move that
+# scored well in a few games ranks below one that did nearly as well in many.
+def getLowerBound(score, games, z=1.96):
+    spread = z * z / games
+    margin = z * math.sqrt(score * (1.0 - score) / games + spread / (4.0 * games))
+    return (score + spread / 2.0 - margin) / (1.0 + spread)
+
+#
+# OpeningBook Class
+#
+# A book file opened for lookups.
+#
+class OpeningBook(object):
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as data:
+            self.size = os.fstat(data.fileno()).st_size
+            self.data = mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        if self.size < HEADER.size:
+            raise ValueError("%s is not an opening book" % path)
+        magic, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != BOOK_MAGIC or HEADER.size + self.count * RECORD.size != self.size:
+            raise ValueError("%s is not an opening book" % path)
+
+    def __len__(self):
+        return self.count
+
+    def getKey(self, index):
+        return struct.unpack_from("<Q", self.data, HEADER.size + index * RECORD.size)[0]
+
+    # The (move, games, score) of each book move in a position, most played first.
+    # score is the average result for the player to move, from 0 to 1.
+    def getMoves(self, position):
+        key = position.hash
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.getKey(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.count or self.getKey(low) != key:
+            return []
+
+        legal = dict(((move.path[0], move.path[-1], move.captures), move) for move in cachedLegalMoves(position))
+        entries = []
+        for index in range(low, self.count):
+            recordKey, origin, target, captures, games, points = RECORD.unpack_from(self.data, HEADER.size + index * RECORD.size)
+            if recordKey != key: break
+            move = legal.get((origin, target, captures))
+            if move is not None:
+                entries.append((move, games, points / (2.0 * games)))
+        entries.sort(key=lambda entry: -entry[1])
+        return entries
+
+    # The book move played at least minGames times that is surest to score
+    # well (see getLowerBound), or None if there isn't one
+    def getMove(self, position, minGames=MIN_GAMES):
+        entries = [entry for entry in self.getMoves(position) if entry[1] >= minGames]
+        if not entries:
+            return None
+        return max(entries, key=lambda entry: (getLowerBound(entry[2], entry[1]), entry[1]))[0]
+
+    def close(self):
+        if self.size:
+            self.data.close()
+
+#
+# Building
+#
+
+# Count the moves played in the first maxPlies plies of every game that
+# starts from the usual start position.
+# Returns {(hash, origin, target, captures): [games, points]} and the number of games.
+def countMoves(paths, maxPlies=24):
+    from pdn import readRecordedGames, WHITE_SCORES
+    start = startingPosition()
+    counts = {}
+    numGames = 0
+    for startPosition, moves, marker in readRecordedGames(paths):
+        score = WHITE_SCORES.get(marker)
+        if score is None or startPosition != start: continue
+        numGames += 1
+        points = int(score * 2)
+        position = start
+        for move in moves[:maxPlies]:
+            key = (position.hash, move.path[0], move.path[-1], move.captures)
+            entry = counts.get(key)
+            if entry is None:
+                entry = counts[key] = [0, 0]
+            entry[0] += 1
+            entry[1] += points if position.player is Player.ONE else 2 - points
+            position = applyMove(position, move)
+    return (counts, numGames)
+
+# Write a book of the moves played at least minGames times
+def writeBook(counts, path, minGames=2):
+    records = sorted((key, entry) for key, entry in counts.items() if entry[0] >= minGames)
+    with open(path, "wb") as output:
+        output.write(HEADER.pack(BOOK_MAGIC, len(records)))
+        for (key, origin, target, captures), (games, points) in records:
+            output.write(RECORD.pack(key, origin, target, captures, games, points))
+    return len(records)
+
+#
+# Command line
+#
+
+# Print the book's main lines from the start position
+def showBook(book, maxPlies=8, minGames=1):
+    from pdn import formatMove
+    def show(position, ply, indent):
+        if ply == maxPlies: return
+        for move, games, score in book.getMoves(position):
+            if games < minGames: continue
+            print("%s%s  %d games, %.1f%%" % ("  " * indent, formatMove(move), games, 100.0 * score))
+            show(applyMove(position, move), ply + 1, indent + 1)
+    show(startingPosition(), 0, 0)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and inspect opening books.")
+    subcommands = parser.add_subparsers(dest="command")
+    buildParser = subcommands.add_parser("build", help="build a book from recorded games")
+    buildParser.add_argument("files", nargs="+", help="simulate.py results files or .pdn files")
+    buildParser.add_argument("--output", default="book.bin", help="book file to write (default: book.bin)")
+    buildParser.add_argument("--plies", type=int, default=24, help="plies of each game to use (default: 24)")
+    buildParser.add_argument("--min-games", type=int, default=2, help="leave out moves played fewer times (default: 2)")
+    showParser = subcommands.add_parser("show", help="print a book's main lines")
+    showParser.add_argument("book")
+    showParser.add_argument("--plies", type=int, default=4, help="plies to show (default: 4)")
+    showParser.add_argument("--min-games", type=int, default=10, help="leave out moves played fewer times (default: 10)")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        startTime = time.time()
+        counts, numGames = countMoves(args.files, args.plies)
+        numRecords = writeBook(counts, args.output, args.min_games)
+        print("%d games, %d moves in %d positions, %d kept, written to %s in %.1fs" %
+              (numGames, len(counts), len(set(key[0] for key in counts)), numRecords, args.output, time.time() - startTime))
+    elif args.command == "show":
+        book = OpeningBook(args.book)
+        showBook(book, args.plies, args.min_games)
+        book.close()
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+#!/usr/local/bin/python3
+#
+# Parallel search
+#
+# Lazy SMP: helper processes search the same position as the main engine at
+# the same time, all sharing one transposition table in shared memory. The
+# helpers' results reach the main search through the table, so it finds
+# cutoffs and good moves sooner. Odd numbered helpers start a ply deeper, so
+# the processes don't all search the same depth at once.
+#
+#   python3 parallelSearch.py --workers 8 --depth 11      compare time to depth with 1 and 8 workers
+#
+
+import os
+import time
+import random
+import argparse
+import multiprocessing
+from multiprocessing import shared_memory
+from rules import *
+from engine import *
+
+# Words (64-bit) at the start of the shared memory before the table. The
+# first is the flag telling the helpers to stop.
+HEADER_WORDS = 1
+
+# Bytes per slot: the key xor'ed with the data, then the data
+SLOT_BYTES = 16
+
+# Bit layout of a slot's data word
+SCORE_OFFSET = 1 << 19
+NO_MOVE = 0xFF
+
+#
+# SharedTranspositionTable Class
+#
+# The same table as TranspositionTable (buckets of a depth-preferred and an
+# always-replace slot) kept in shared memory, so several processes can use it.
+# Each slot is two 64-bit words, the data and the key xor'ed with the data.
+# Processes write without locking, so a slot being written by two processes
+# at once can end up mixed, but then its key no longer matches and it is
+# simply not found.
+#
+class SharedTranspositionTable(object):
+    def __init__(self, megabytes=32, name=None):
+        if name is None:
+            size = 2
+            while size * 2 * SLOT_BYTES <= megabytes * 1024 * 1024:
+                size *= 2
+            self.memory = shared_memory.SharedMemory(create=True, size=8 * HEADER_WORDS + size * SLOT_BYTES)
+            self.owner = True
+        else:
+            # Helpers share the resource tracker of the process that made the
+            # memory, and only that process frees it
+            self.memory = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.name = self.memory.name
+        self.words = self.memory.buf.cast("Q")
+        self.size = (len(self.words) - HEADER_WORDS) // 2
+        self.mask = (self.size - 1) & ~1
+        self.generation = 0
+
+    def newSearch(self):
+        self.generation = (self.generation + 1) & 0xFF
+
+    def clear(self):
+        start = 8 * HEADER_WORDS
+        self.memory.buf[start:] = bytes(len(self.memory.buf) - start)
+
+    # Set or read the flag that tells the helpers to stop searching
+    def setStopped(self, stopped):
+        self.words[0] = 1 if stopped else 0
+
+    def isStopped(self):
+        return self.words[0] != 0
+
+    # Return the (key, depth, bound, score, moveIndex, generation) entry for the key, or None
+    def probe(self, key):
+        words = self.words
+        index = HEADER_WORDS + 2 * (key & self.mask)
+        data = words[index + 1]
+        if data and words[index] ^ data == key:
+            return decodeSlot(key, data)
+        data = words[index + 3]
+        if data and words[index + 2] ^ data == key:
+            return decodeSlot(key, data)
+        return None
+
+    # Store the result of searching a position
+    def store(self, key, depth, bound, score, moveIndex):
+        words = self.words
+        index = HEADER_WORDS + 2 * (key & self.mask)
+        data = words[index + 1]
+        if data:
+            currentKey = words[index] ^ data
+            if currentKey != key and data & 0xFF == self.generation and depth < (data >> 18) & 0xFF:
+                index += 2
+        data = encodeSlot(depth, bound, score, moveIndex, self.generation)
+        words[index] = key ^ data
+        words[index + 1] = data
+
+    def close(self):
+        self.words.release()
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+# Pack an entry into a slot's data word. It is never 0, which marks an empty slot.
+def encodeSlot(depth, bound, score, moveIndex, generation):
+    if moveIndex is None or moveIndex >= NO_MOVE:
+        moveIndex = NO_MOVE
+    return ((score + SCORE_OFFSET) << 26) | (min(max(depth, 0), 0xFF) << 18) | (bound << 16) | (moveIndex << 8) | generation
+
+def decodeSlot(key, data):
+    moveIndex = (data >> 8) & 0xFF
+    return (key, (data >> 18) & 0xFF, (data >> 16) & 0x3, (data >> 26) - SCORE_OFFSET,
+            None if moveIndex == NO_MOVE else moveIndex, data & 0xFF)
+
+#
+# HelperEngine Class
+#
+# An engine in a helper process. It searches deeper and deeper until the main
+# engine sets the table's stop flag (or its time runs out).
+#
+class HelperEngine(Engine):
+    def isOutOfTime(self):
+        return self.table.isStopped() or time.time() > self.deadline
+
+    def searchUntilStopped(self, position, firstDepth):
+        self.startSearch()
+        if len(cachedLegalMoves(position)) <= 1:
+            return
+        key = getHash(position)
+        try:
+            for depth in range(firstDepth, self.maxDepth + 1):
+                self.negamax(position, key, depth, -INFINITY, INFINITY, 0)
+                self.depth = depth
+        except SearchTimeout:
+            pass
+
+# Body of a helper process. Searches each position it is sent and replies
+# with the number of nodes it searched, until it's sent None.
+def runHelper(tableName, workerIndex, connection):
+    table = SharedTranspositionTable(name=tableName)
+    engine = HelperEngine(table=table)
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        position, timeLimit, maxDepth, generation = request
+        engine.timeLimit = timeLimit
+        engine.maxDepth = maxDepth
+        table.generation = (generation - 1) & 0xFF
+        engine.searchUntilStopped(position, 1 + workerIndex % 2)
+        connection.send((engine.nodes, engine.depth))
+    table.close()
+
+#
+# ParallelEngine Class
+#
+# An Engine that searches with workers processes: itself and workers - 1
+# helpers. Used like Engine. Call close() to stop the helpers.
+#
+class ParallelEngine(Engine):
+    def __init__(self, timeLimit=1.0, maxDepth=64, tableSize=32, workers=None):
+        Engine.__init__(self, timeLimit, maxDepth, table=SharedTranspositionTable(tableSize))
+        self.workers = workers or os.cpu_count() or 1
+
+        # Helpers are started fresh rather than forked, so they don't inherit a window or a pygame state
+        context = multiprocessing.get_context("spawn")
+        self.helpers = []
+        for workerIndex in range(1, self.workers):
+            connection, helperConnection = context.Pipe()
+            process = context.Process(target=runHelper, args=(self.table.name, workerIndex, helperConnection), daemon=True)
+            process.start()
+            self.helpers.append((process, connection))
+
+        # Nodes searched by each worker in the last search, the main engine first
+        self.workerNodes = [0] * self.workers
+
+    def search(self, position):
+        self.table.setStopped(False)
+        for process, connection in self.helpers:
+            connection.send((position, self.timeLimit, self.maxDepth, self.table.generation + 1))
+        try:
+            return Engine.search(self, position)
+        finally:
+            self.table.setStopped(True)
+            self.workerNodes = [self.nodes] + [connection.recv()[0] for process, connection in self.helpers]
+
+    # Nodes per second of each worker in the last search
+    def getWorkerSpeeds(self):
+        elapsed = max(self.elapsed, 1e-9)
+        return [nodes / elapsed for nodes in self.workerNodes]
+
+    def close(self):
+        for process, connection in self.helpers:
+            connection.send(None)
+        for process, connection in self.helpers:
+            process.join()
+        self.helpers = []
+        self.table.close()
+
+#
+# Benchmark
+#
+
+# Positions a few moves into some games, to search in the benchmark
+def getBenchmarkPositions(count, seed=1):
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        position = startingPosition()
+        for ply in range(rng.randrange(4, 16)):
+            moves = legalMoves(position)
+            if not moves: break
+            position = applyMove(position, rng.choice(moves))
+        if len(legalMoves(position)) > 1:
+            positions.append(position)
+    return positions
+
+# Search each position to a fixed depth. Returns the total time and the engine.
+def timeToDepth(engine, positions):
+    totalTime = 0.0
+    for position in positions:
+        engine.table.clear()
+        startTime = time.time()
+        engine.search(position)
+        totalTime += time.time() - startTime
+    return totalTime
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure how much faster the search is with more processes.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes to search with (default: one per core)")
+    parser.add_argument("--depth", type=int, default=10, help="depth to search each position to (default: 10)")
+    parser.add_argument("--positions", type=int, default=8, help="number of positions (default: 8)")
+    args = parser.parse_args(argv)
+
+    positions = getBenchmarkPositions(args.positions)
+    single = Engine(timeLimit=1e9, maxDepth=args.depth)
+    singleTime = timeToDepth(single, positions)
+    print("1 worker: %.2fs to depth %d" % (singleTime, args.depth))
+
+    engine = ParallelEngine(timeLimit=1e9, maxDepth=args.depth, workers=args.workers)
+    try:
+        parallelTime = 0.0
+        workerNodes = [0] * engine.workers
+        for position in positions:
+            parallelTime += timeToDepth(engine, [position])
+            workerNodes = [total + nodes for total, nodes in zip(workerNodes, engine.workerNodes)]
+    finally:
+        engine.close()
+    print("%d workers: %.2fs to depth %d, speedup %.2fx" % (engine.workers, parallelTime, args.depth, singleTime / parallelTime))
+    for workerIndex, nodes in enumerate(workerNodes):
+        print("  worker %d: %d nodes, %.0f nodes/sec" % (workerIndex, nodes, nodes / parallelTime))
+    print("  total: %.0f nodes/sec" % (sum(workerNodes) / parallelTime))
+
+if __name__ == "__main__":
+    main()
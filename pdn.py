@@ -0,0 +1,387 @@
+#!/usr/local/bin/python3
+#
+# PDN (Portable Draughts Notation) import and export
+#
+# PDN numbers the dark squares 1-32 from black's back row (1-4) to white's
+# (29-32). Black moves first, so black is Player.TWO (the yellow pieces) and
+# white is Player.ONE. Moves are the numbers of the squares a piece visits,
+# joined by '-' for a quiet move or 'x' for a capture ("11-15", "22x15x6").
+# Captures may also be written with just the start and end square when that
+# isn't ambiguous.
+#
+# Files are read a line at a time and games are handed out one by one, so a
+# collection of any size is read in constant memory.
+#
+#   python3 pdn.py check games.pdn ...           replay and validate every game
+#   python3 pdn.py export results.txt games.pdn  convert simulate.py results to PDN
+#
+
+import os
+import re
+import sys
+import time
+import argparse
+from collections import namedtuple
+from rules import *
+
+# A game as read from a file. headers is a dict of the tag pairs, moves the
+# list of move texts and result the game termination marker.
+PdnGame = namedtuple('PdnGame', ['headers', 'moves', 'result'])
+
+# Raised for text that isn't valid PDN, or a game with an illegal move
+class PdnError(Exception):
+    pass
+
+# Game termination markers (both the chess style and the 2-point draughts style)
+RESULTS = {"1-0", "0-1", "1/2-1/2", "2-0", "0-2", "1-1", "0-0", "*"}
+
+# White's score for each finished game's marker
+WHITE_SCORES = {"1-0": 1.0, "2-0": 1.0, "0-1": 0.0, "0-2": 0.0, "1/2-1/2": 0.5, "1-1": 0.5}
+
+# Winners in a simulate.py results file
+RESULTS_FILE_WINNERS = {"W": Player.ONE, "Y": Player.TWO, "D": None}
+
+# The PDN GameType for English draughts / American checkers
+GAME_TYPE = "21"
+
+TOKEN = re.compile(r'\[[^\]]*\]|[{}()]|[^\s{}()\[\]]+')
+HEADER = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+MOVE_NUMBER = re.compile(r'^\d+\.+')
+MOVE = re.compile(r'^(\d+(?:[-x:]\d+)+)[!?*]*$')
+
+#
+# Square numbers
+#
+
+# PDN number (1-32) of a square (0-31, see bitboard.py)
+def squareToNumber(square):
+    (x,y) = indexFromSquare(square)
+    return 4*(7-y) + x//2 + 1
+
+# Square (0-31) of a PDN number (1-32)
+def numberToSquare(number):
+    if not 1 <= number <= 32:
+        raise PdnError("no square %d" % number)
+    y = 7 - (number - 1)//4
+    x = 2*((number - 1) % 4) + (y % 2)
+    return squareFromIndex(x, y)
+
+#
+# FEN
+#
+# A position is written as the side to move and the pieces of each side, with
+# kings marked by K, e.g. "B:W21,22,23,K30:B1,2,3". Runs of squares may be
+# written as ranges ("W21-32").
+#
+
+# Position from FEN text
+def parseFen(text):
+    fields = text.strip().strip('"').split(":")
+    if len(fields) != 3 or fields[0].upper() not in ("B", "W"):
+        raise PdnError("bad FEN %r" % text)
+    player = Player.TWO if fields[0].upper() == "B" else Player.ONE
+    pieces = {"W": 0, "B": 0}
+    kings = 0
+    for field in fields[1:]:
+        side = field[:1].upper()
+        if side not in pieces:
+            raise PdnError("bad FEN %r" % text)
+        for item in field[1:].split(","):
+            item = item.strip().split(".")[0]
+            if not item: continue
+            king = item[:1].upper() == "K"
+            if king:
+                item = item[1:]
+            try:
+                if "-" in item:
+                    first, last = item.split("-")
+                    numbers = range(int(first), int(last) + 1)
+                else:
+                    numbers = [int(item)]
+            except ValueError:
+                raise PdnError("bad FEN %r" % text)
+            for number in numbers:
+                bit = 1 << numberToSquare(number)
+                pieces[side] |= bit
+                if king:
+                    kings |= bit
+    if pieces["W"] & pieces["B"]:
+        raise PdnError("bad FEN %r: a square has two pieces" % text)
+    return Position(pieces["W"], pieces["B"], kings, player)
+
+# FEN text of a position
+def formatFen(position):
+    def formatSide(bitboard):
+        numbers = sorted((squareToNumber(square), square) for square in iterSquares(bitboard))
+        return ",".join(("K%d" if position.kings & (1 << square) else "%d") % number for number, square in numbers)
+    player = "B" if position.player is Player.TWO else "W"
+    return "%s:W%s:B%s" % (player, formatSide(position.white), formatSide(position.yellow))
+
+#
+# Reading
+#
+
+# Split lines of PDN into tokens, leaving out comments and variations.
+# Returns a generator of ("header", (key, value)) and ("move", text).
+def readTokens(lines):
+    commentDepth = 0
+    variationDepth = 0
+    for line in lines:
+        if line.startswith("%"):
+            continue
+        for token in TOKEN.findall(line):
+            if commentDepth:
+                if token == "}": commentDepth -= 1
+                continue
+            if token == "{":
+                commentDepth += 1
+            elif token == "(":
+                variationDepth += 1
+            elif token == ")":
+                variationDepth = max(0, variationDepth - 1)
+            elif variationDepth:
+                continue
+            elif token.startswith("["):
+                header = HEADER.match(token)
+                if header is None:
+                    raise PdnError("bad tag %s" % token)
+                yield ("header", (header.group(1), header.group(2).replace('\\"', '"')))
+            else:
+                yield ("move", token)
+
+# Read games from lines of PDN (an open file works). Returns a generator of
+# PdnGame. A game ends at its result, or when the next game's tags start.
+def readGames(lines):
+    headers = {}
+    moves = []
+    for kind, value in readTokens(lines):
+        if kind == "header":
+            if moves:
+                yield PdnGame(headers, moves, headers.get("Result", "*"))
+                headers, moves = {}, []
+            headers[value[0]] = value[1]
+            continue
+
+        text = MOVE_NUMBER.sub("", value)
+        if not text or text.startswith("$"):
+            continue
+        if text in RESULTS:
+            yield PdnGame(headers, moves, text)
+            headers, moves = {}, []
+        else:
+            moves.append(text)
+    if headers or moves:
+        yield PdnGame(headers, moves, headers.get("Result", "*"))
+
+# The legal move in the position that a move text describes
+def parseMove(position, text):
+    match = MOVE.match(text)
+    if match is None:
+        raise PdnError("bad move %r" % text)
+    path = tuple(numberToSquare(int(number)) for number in re.split(r'[-x:]', match.group(1)))
+
+    matches = [move for move in legalMoves(position)
+               if move.path == path or (len(path) == 2 and move.path[0] == path[0] and move.path[-1] == path[-1])]
+    if not matches:
+        raise PdnError("illegal move %s" % text)
+    if len(matches) > 1:
+        raise PdnError("ambiguous move %s" % text)
+    return matches[0]
+
+# The position a game starts from
+def getStartPosition(game):
+    if game.headers.get("GameType", GAME_TYPE).split(",")[0] != GAME_TYPE:
+        raise PdnError("unsupported game type %s" % game.headers["GameType"])
+    if "FEN" in game.headers:
+        return parseFen(game.headers["FEN"])
+    return startingPosition()
+
+# Replay a game, checking every move is legal.
+# Returns the start position and the list of moves.
+def replayGame(game):
+    startPosition = getStartPosition(game)
+    position = startPosition
+    moves = []
+    for text in game.moves:
+        try:
+            move = parseMove(position, text)
+        except PdnError as error:
+            raise PdnError("move %d: %s" % (len(moves) + 1, error))
+        moves.append(move)
+        position = applyMove(position, move)
+    return (startPosition, moves)
+
+# Read one game line of a simulate.py results file (see simulate.py).
+# Returns (game number, winner, moves, final position), or None for a line
+# without a game. Raises PdnError for an unknown winner or an illegal move.
+def readResult(line):
+    fields = line.split()
+    if len(fields) < 3: return None
+    if fields[1] not in RESULTS_FILE_WINNERS:
+        raise PdnError("game %s: unknown winner %r" % (fields[0], fields[1]))
+    position = startingPosition()
+    moves = []
+    for text in fields[3:]:
+        try:
+            path = tuple(int(square) for square in re.split(r'[-x]', text))
+        except ValueError:
+            raise PdnError("game %s: move %d: can't read %r" % (fields[0], len(moves) + 1, text))
+        matches = [move for move in cachedLegalMoves(position) if move.path == path]
+        if not matches:
+            raise PdnError("game %s: move %d: %r is not legal" % (fields[0], len(moves) + 1, text))
+        moves.append(matches[0])
+        position = applyMove(position, matches[0])
+    return (fields[0], RESULTS_FILE_WINNERS[fields[1]], moves, position)
+
+# Read the games in a simulate.py results file.
+# Yields (game number, winner, moves, final position) for each.
+def readResults(lines):
+    for line in lines:
+        game = readResult(line)
+        if game is not None:
+            yield game
+
+# Yield (start position, moves, result marker) for every game in PDN files
+# (.pdn) and simulate.py results files. Games stopped at simulate.py's ply
+# limit count as draws. Invalid games are left out.
+def readRecordedGames(paths):
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as lines:
+            if path.endswith(".pdn"):
+                for game in readGames(lines):
+                    try:
+                        startPosition, moves = replayGame(game)
+                    except PdnError:
+                        continue
+                    yield (startPosition, moves, game.result)
+            else:
+                for line in lines:
+                    try:
+                        game = readResult(line)
+                    except PdnError:
+                        continue
+                    if game is not None:
+                        yield (startingPosition(), game[2], formatResult(game[1]))
+
+#
+# Writing
+#
+
+# PDN text for a move
+def formatMove(move):
+    separator = "x" if move.captures else "-"
+    return separator.join(str(squareToNumber(square)) for square in move.path)
+
+# Result marker for the winner of a game (None for a draw or unfinished game)
+def formatResult(winner, finished=True):
+    if winner is Player.ONE: return "1-0"
+    if winner is Player.TWO: return "0-1"
+    return "1/2-1/2" if finished else "*"
+
+# PDN text for a game, wrapped at 80 columns
+def formatGame(moves, headers=None, result="*", position=None):
+    headers = dict(headers or {})
+    headers.setdefault("GameType", GAME_TYPE)
+    headers["Result"] = result
+    if position is None:
+        position = startingPosition()
+    elif position != startingPosition():
+        headers["FEN"] = formatFen(position)
+
+    lines = ['[%s "%s"]' % (key, str(value).replace('"', '\\"')) for key, value in headers.items()]
+    lines.append("")
+
+    # Black moves first, so white's first move from a FEN is numbered "1..."
+    words = []
+    moveNumber = 1
+    player = position.player
+    if player is Player.ONE and moves:
+        words.append("1...")
+    for move in moves:
+        if player is Player.TWO:
+            words.append("%d." % moveNumber)
+        else:
+            moveNumber += 1
+        words.append(formatMove(move))
+        player = getOpponent(player)
+    words.append(result)
+
+    line = ""
+    for word in words:
+        if line and len(line) + 1 + len(word) > 80:
+            lines.append(line)
+            line = word
+        else:
+            line = (line + " " + word) if line else word
+    lines.append(line)
+    return "\n".join(lines) + "\n\n"
+
+#
+# Command line
+#
+
+# Replay and validate every game in a file. Prints the errors and the
+# file's statistics, and returns the number of invalid games.
+def checkFile(path, maxErrors=10):
+    startTime = time.time()
+    numGames = numMoves = invalid = 0
+    with open(path, encoding="utf-8", errors="replace") as lines:
+        for game in readGames(lines):
+            numGames += 1
+            try:
+                position, moves = replayGame(game)
+                numMoves += len(moves)
+            except PdnError as error:
+                invalid += 1
+                if invalid <= maxErrors:
+                    print("%s: game %d: %s" % (path, numGames, error))
+
+    elapsed = max(time.time() - startTime, 1e-9)
+    megabytes = os.path.getsize(path) / (1024.0 * 1024.0)
+    print("%s: %d games (%d invalid), %d moves in %.2fs - %.1f MB/sec, %.0f games/sec, %.0f moves/sec" %
+          (path, numGames, invalid, numMoves, elapsed, megabytes / elapsed, numGames / elapsed, numMoves / elapsed))
+    return invalid
+
+# Convert a simulate.py results file to PDN, leaving out invalid games.
+# Returns the number of invalid games.
+def exportResults(path, output):
+    invalid = 0
+    with open(path) as lines, open(output, "w") as pdn:
+        for line in lines:
+            try:
+                game = readResult(line)
+            except PdnError as error:
+                print("%s: %s" % (path, error), file=sys.stderr)
+                invalid += 1
+                continue
+            if game is None: continue
+            number, winner, moves, position = game
+            marker = formatResult(winner, result(position) is not None)
+            pdn.write(formatGame(moves, {"Event": "Self-play game %s" % number}, marker))
+    return invalid
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read and write PDN game files.")
+    subcommands = parser.add_subparsers(dest="command")
+    checkParser = subcommands.add_parser("check", help="replay and validate every game in PDN files")
+    checkParser.add_argument("files", nargs="+")
+    checkParser.add_argument("--max-errors", type=int, default=10, help="errors to print per file (default: 10)")
+    exportParser = subcommands.add_parser("export", help="convert a simulate.py results file to PDN")
+    exportParser.add_argument("results")
+    exportParser.add_argument("output")
+    args = parser.parse_args(argv)
+
+    if args.command == "check":
+        invalid = 0
+        for path in args.files:
+            invalid += checkFile(path, args.max_errors)
+        if invalid:
+            sys.exit(1)
+    elif args.command == "export":
+        if exportResults(args.results, args.output):
+            sys.exit(1)
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/local/bin/python3
+#
+# Perft
+#
+# Counts the positions reachable in exactly D moves (plies) to check move
+# generation is correct, and times it to see how fast it is.
+#
+#   python3 perft.py --depth 8               count from the starting position
+#   python3 perft.py --depth 6 --divide      break the count down by first move
+#   python3 perft.py --check                 compare every known count (exits 1 on a mismatch)
+#   python3 perft.py --check --json          ... and print the results as JSON lines for tracking
+#
+# The starting position counts are the published 8x8 checkers perft numbers.
+# The other positions' counts are regression values recorded from this
+# generator, so changes to move generation can't quietly change them.
+#
+
+import sys
+import time
+import json
+import argparse
+from rules import *
+
+# Build a position from lists of squares (0-31, see bitboard.py)
+def makePosition(white, yellow, kings, player):
+    bitboard = lambda squares: sum(1 << square for square in squares)
+    return Position(bitboard(white), bitboard(yellow), bitboard(kings), player)
+
+# name -> (position, counts for depth 1, 2, 3...)
+POSITIONS = {
+    "start": (startingPosition(),
+              [7, 49, 302, 1469, 7361, 36768, 179740, 845931, 3963680, 18391564, 85242128, 388623673]),
+    # Kings and men for both sides in the middle of the board, with captures available
+    "kings": (makePosition([5, 6, 13, 21], [18, 25, 26, 29], [13, 21, 18], Player.ONE),
+              [4, 9, 62, 248, 1404, 5763, 31293]),
+    # A man with several branching multi-jumps available
+    "jumps": (makePosition([1, 2, 30], [5, 6, 13, 14, 21, 22], [30], Player.ONE),
+              [6, 32, 102, 477, 2267, 11029, 57308]),
+    # Men on both sides one step from being crowned
+    "crowning": (makePosition([24, 25, 27, 9], [4, 6, 7, 22], [], Player.TWO),
+                 [7, 49, 309, 1925, 11547, 70393, 439340]),
+}
+
+# Number of positions reachable in exactly depth plies
+def perft(position, depth):
+    moves = legalMoves(position)
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    count = 0
+    for move in moves:
+        count += perft(applyMove(position, move), depth - 1)
+    return count
+
+# perft for each first move. Returns a list of (move, count).
+def divide(position, depth):
+    return [(move, perft(applyMove(position, move), depth - 1)) for move in legalMoves(position)]
+
+# Run perft and time it. Returns (count, seconds).
+def timedPerft(position, depth):
+    startTime = time.time()
+    count = perft(position, depth)
+    return (count, time.time() - startTime)
+
+# Print a perft result, as text or as a JSON line
+def report(name, depth, count, elapsed, expected, asJson):
+    nodesPerSecond = count / elapsed if elapsed > 0 else 0.0
+    if asJson:
+        print(json.dumps({"position": name, "depth": depth, "nodes": count, "expected": expected,
+                          "seconds": round(elapsed, 4), "nodesPerSecond": int(nodesPerSecond)}))
+    else:
+        status = "" if expected is None else ("  ok" if count == expected else "  MISMATCH (expected %d)" % expected)
+        print("%-9s depth %2d: %12d nodes in %7.2fs (%9.0f nodes/sec)%s" % (name, depth, count, elapsed, nodesPerSecond, status))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count and time move generation.")
+    parser.add_argument("--position", choices=sorted(POSITIONS), default="start", help="position to count from (default: start)")
+    parser.add_argument("--depth", type=int, default=6, help="depth in plies (default: 6)")
+    parser.add_argument("--divide", action="store_true", help="show the count for each first move")
+    parser.add_argument("--check", action="store_true", help="check every position against its known counts")
+    parser.add_argument("--max-nodes", type=int, default=1000000, help="with --check, skip depths with more nodes than this (default: 1000000)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON lines")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        failures = 0
+        for name in sorted(POSITIONS):
+            position, counts = POSITIONS[name]
+            for depth, expected in enumerate(counts, 1):
+                if expected > args.max_nodes: break
+                count, elapsed = timedPerft(position, depth)
+                report(name, depth, count, elapsed, expected, args.json)
+                if count != expected:
+                    failures += 1
+        if failures:
+            print("%d perft counts did not match" % failures)
+            sys.exit(1)
+        return
+
+    position, counts = POSITIONS[args.position]
+    expected = counts[args.depth - 1] if 1 <= args.depth <= len(counts) else None
+    if args.divide:
+        from simulate import getMoveText
+        total = 0
+        startTime = time.time()
+        for move, count in divide(position, args.depth):
+            print("%-12s %d" % (getMoveText(move), count))
+            total += count
+        elapsed = time.time() - startTime
+    else:
+        total, elapsed = timedPerft(position, args.depth)
+    report(args.position, args.depth, total, elapsed, expected, args.json)
+    if expected is not None and total != expected:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import random
+from rules import *
+from engine import Engine
+
+#
+# Players
+#
+# Things that can choose a move without a human at the mouse. Each player has
+# a getMove(position, moves) method that picks one of the legal moves.
+#
+
+# Plays a random legal move
+class RandomPlayer(object):
+    def __init__(self, seed=None):
+        self.random = random.Random(seed)
+
+    def getMove(self, position, moves):
+        return self.random.choice(moves)
+
+# Plays a fixed script of move choices (indices into the legal move list,
+# wrapped around if too big), then the first legal move once the script runs
+# out. The same script always gives the same game.
+class ScriptedPlayer(object):
+    def __init__(self, script=()):
+        self.script = list(script)
+        self.turn = 0
+
+    def getMove(self, position, moves):
+        choice = self.script[self.turn] if self.turn < len(self.script) else 0
+        self.turn += 1
+        return moves[choice % len(moves)]
+
+# Plays the move an engine (see engine.py) finds, or a move from an opening book
+class EnginePlayer(object):
+    def __init__(self, timeLimit=0.1, maxDepth=64, tableSize=16, book=None, bookMinGames=10):
+        self.engine = Engine(timeLimit, maxDepth, tableSize, book=book, bookMinGames=bookMinGames)
+
+    def getMove(self, position, moves):
+        if len(moves) == 1:
+            return moves[0]
+        return self.engine.search(position)
+
+# Build a player from its name
+def createPlayer(name, seed=None, timeLimit=0.1, maxDepth=64):
+    if name == "random":
+        return RandomPlayer(seed)
+    if name == "scripted":
+        return ScriptedPlayer(random.Random(seed).randrange(8) for turn in range(4))
+    if name == "engine":
+        return EnginePlayer(timeLimit, maxDepth)
+    raise ValueError("Unknown player: %s" % name)
+
+PLAYER_NAMES = ["random", "scripted", "engine"]
+
+# Play a game between two players from a position. Returns the winner
+# (None for a game stopped after maxPlies) and the list of moves played.
+def playGame(whitePlayer, yellowPlayer, maxPlies=200, position=None):
+    if position is None:
+        position = startingPosition()
+    moves = []
+    while len(moves) < maxPlies:
+        legal = cachedLegalMoves(position)
+        if not legal:
+            return (getOpponent(position.player), moves)
+        player = whitePlayer if position.player is Player.ONE else yellowPlayer
+        move = player.getMove(position, legal)
+        moves.append(move)
+        position = applyMove(position, move)
+    return (result(position), moves)
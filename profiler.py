@@ -0,0 +1,136 @@
+import sys
+import csv
+import json
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+#
+# Profiler Class
+#
+# Times the parts of each frame and counts calls to the functions on the hot
+# path. Functions are measured by replacing them with a timing wrapper when
+# they are instrumented, so when profiling is off nothing is replaced and
+# nothing is measured.
+#
+# Every interval seconds the totals since the last dump are written to a file,
+# as JSON lines, or as CSV if the file name ends in .csv.
+#
+class Profiler(object):
+    def __init__(self, output=None, interval=5.0):
+        self.output = output
+        self.interval = interval
+
+        # name -> [calls, seconds] for the current frame, since the last dump and since the start
+        self.frame = {}
+        self.period = {}
+        self.total = {}
+        self.names = []
+
+        # Milliseconds taken by the last frame, and the frames since the last dump
+        self.frameStart = None
+        self.frameTime = 0.0
+        self.lastFrame = {}
+        self.periodFrames = 0
+        self.periodFrameTime = 0.0
+        self.periodMaxFrameTime = 0.0
+        self.lastDump = time.time()
+
+    # Replace owner.name (a method of a class, or a function in a module) with
+    # a version that records its calls and time under label
+    def instrument(self, owner, name, label=None):
+        function = getattr(owner, name)
+        label = label or "%s.%s" % (getattr(owner, "__name__", owner), name)
+        if label not in self.names:
+            self.names.append(label)
+        profiler = self
+        def instrumented(*args, **kwargs):
+            startTime = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.record(label, time.perf_counter() - startTime)
+        instrumented.__wrapped__ = function
+        setattr(owner, name, instrumented)
+
+    def record(self, label, seconds):
+        entry = self.frame.get(label)
+        if entry is None:
+            self.frame[label] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+    def startFrame(self):
+        self.frameStart = time.perf_counter()
+
+    # Finish the frame's measurements, and dump them if it's time to
+    def endFrame(self):
+        if self.frameStart is None: return
+        self.frameTime = (time.perf_counter() - self.frameStart) * 1000.0
+        self.frameStart = None
+        self.periodFrames += 1
+        self.periodFrameTime += self.frameTime
+        self.periodMaxFrameTime = max(self.periodMaxFrameTime, self.frameTime)
+        for label, (calls, seconds) in self.frame.items():
+            for totals in (self.period, self.total):
+                entry = totals.setdefault(label, [0, 0.0])
+                entry[0] += calls
+                entry[1] += seconds
+        self.lastFrame = self.frame
+        self.frame = {}
+
+        if self.output is not None and time.time() - self.lastDump >= self.interval:
+            self.dump()
+
+    # Highest memory use of the process so far, in megabytes (None if it can't be found)
+    def getMaxRss(self):
+        if resource is None: return None
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return maxrss / (1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0)
+
+    # The measurements since the last dump, as a flat dict
+    def getSummary(self):
+        frames = max(self.periodFrames, 1)
+        summary = {"time": round(time.time(), 3), "frames": self.periodFrames,
+                   "frameMs": round(self.periodFrameTime / frames, 3), "maxFrameMs": round(self.periodMaxFrameTime, 3),
+                   "maxRssMb": self.getMaxRss()}
+        for label in self.names:
+            calls, seconds = self.period.get(label, (0, 0.0))
+            summary[label + " calls"] = calls
+            summary[label + " ms"] = round(seconds * 1000.0, 3)
+        return summary
+
+    # Write the measurements since the last dump to the output file
+    def dump(self):
+        summary = self.getSummary()
+        if self.output.endswith(".csv"):
+            with open(self.output, "a", newline="") as output:
+                writer = csv.DictWriter(output, fieldnames=list(summary))
+                if output.tell() == 0:
+                    writer.writeheader()
+                writer.writerow(summary)
+        else:
+            with open(self.output, "a") as output:
+                output.write(json.dumps(summary) + "\n")
+        self.period = {}
+        self.periodFrames = 0
+        self.periodFrameTime = 0.0
+        self.periodMaxFrameTime = 0.0
+        self.lastDump = time.time()
+
+    # Lines of text describing the last frame, for the on-screen overlay
+    def getOverlayLines(self):
+        lines = ["frame %.2f ms" % self.frameTime]
+        for label in self.names:
+            calls, seconds = self.lastFrame.get(label, (0, 0.0))
+            totalCalls = self.total.get(label, (0, 0.0))[0]
+            lines.append("%s %.2f ms x%d (%d)" % (label, seconds * 1000.0, calls, totalCalls))
+        maxRss = self.getMaxRss()
+        if maxRss is not None:
+            lines.append("max rss %.1f MB" % maxRss)
+        return lines
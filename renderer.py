@@ -0,0 +1,168 @@
+import pygame
+from board import *
+
+#
+# SpriteRenderer Class
+#
+# Draws a CheckersBoard the same way CheckersBoard.draw does, but only redraws
+# what changed since the last frame. The board squares are drawn once onto a
+# background surface and each kind of piece is drawn once onto a sprite, so a
+# frame is a handful of blits.
+#
+# Each frame is described as a list of items (highlighted squares, the move
+# path, pieces, the winning text). Items that appeared, disappeared or moved
+# since the last frame mark their area as dirty, and only the dirty areas are
+# redrawn. draw() returns those areas for pygame.display.update.
+#
+class SpriteRenderer(object):
+    # Redraw the whole board instead once this many areas are dirty
+    MAX_DIRTY_RECTS = 24
+
+    def __init__(self, board):
+        self.board = board
+        self.background = None
+        self.sprites = {}
+        self.squares = {}
+        self.previousItems = None
+
+        # Sprites are big enough for the piece outline plus a pixel of slack
+        self.spriteSize = 2*int(board.pieceSize*1.15) + 4
+
+    # Forget everything drawn so far, so the next frame is drawn in full
+    def invalidate(self):
+        self.previousItems = None
+
+    # The board squares, drawn once
+    def getBackground(self):
+        if self.background is None:
+            self.background = pygame.Surface((self.board.boardSize, self.board.boardSize))
+            self.board.drawGrid(self.background)
+        return self.background
+
+    # A piece drawn once for each combination of piece, selectable highlight and chopping block X
+    def getSprite(self, piece, selectable, chopped):
+        key = (piece, selectable, chopped)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            sprite = pygame.Surface((self.spriteSize, self.spriteSize), pygame.SRCALPHA)
+            self.board.drawPieceShape(sprite, piece, (self.spriteSize//2, self.spriteSize//2), selectable, chopped)
+            self.sprites[key] = sprite
+        return sprite
+
+    # A square filled with a highlight colour
+    def getSquare(self, color):
+        square = self.squares.get(color)
+        if square is None:
+            size = self.board.squareSize
+            square = pygame.Surface((size, size))
+            square.fill(color)
+            self.squares[color] = square
+        return square
+
+    # Area covered by a square of the board
+    def getSquareRect(self, x, y):
+        size = self.board.squareSize
+        return pygame.Rect(size*x, size*y, size, size)
+
+    # Area covered by a piece sprite centred on pos
+    def getSpriteRect(self, pos):
+        return pygame.Rect(pos[0] - self.spriteSize//2, pos[1] - self.spriteSize//2, self.spriteSize, self.spriteSize)
+
+    # Describe everything that should be on screen this frame as a list of
+    # (key, rect) items, in drawing order. The key says everything about how
+    # the item looks, so an unchanged key means the item doesn't need redrawing.
+    def getItems(self):
+        board = self.board
+        game = board.game
+        items = []
+
+        # Legal moves for the piece being dragged, and the one under the cursor
+        if board.draggingPiece is not None and board.draggingPieceTarget is None:
+            for x,y in game.visibleLegalMoves:
+                items.append((("legal", x, y), self.getSquareRect(x, y)))
+        if board.highLight is not None:
+            x,y = board.highLight
+            items.append((("highlight", x, y), self.getSquareRect(x, y)))
+
+        # The path the picked up piece will take
+        if board.currentMoveSequence:
+            points = tuple(board.currentMoveSequence)
+            left = min(x for x,y in points)
+            top = min(y for x,y in points)
+            right = max(x for x,y in points)
+            bottom = max(y for x,y in points)
+            margin = board.pieceSize
+            items.append((("path", points), pygame.Rect(left - margin, top - margin, right - left + 2*margin, bottom - top + 2*margin)))
+
+        # The pieces, with the one being dragged drawn last so it's on top
+        dragging = None
+        if board.draggingPiece is not None:
+            ((dragX, dragY, piece), pos) = board.draggingPiece
+            dragging = (dragX, dragY)
+        for square in iterSquares(board.position.white | board.position.yellow):
+            x,y = indexFromSquare(square)
+            if (x,y) == dragging: continue
+            piece = board.get(x, y)
+            pos = board.getPiecePositionFromIndex(x, y)
+            items.append((("piece", piece, (x,y) in game.selectableSquares, (x,y) in board.choppingBlock, pos), self.getSpriteRect(pos)))
+        if dragging is not None:
+            x,y = dragging
+            pos = board.draggingPiece[1]
+            items.append((("piece", board.get(x, y), dragging in game.selectableSquares, dragging in board.choppingBlock, pos), self.getSpriteRect(pos)))
+
+        # The winning text
+        if board.winner:
+            label = board.getWinnerLabel()
+            items.append((("winner", board.winner), label.get_rect(topleft=(105, 200))))
+        return items
+
+    # Draw one item
+    def drawItem(self, screen, key):
+        kind = key[0]
+        if kind == "legal":
+            screen.blit(self.getSquare(Square.LEGAL), self.getSquareRect(key[1], key[2]))
+        elif kind == "highlight":
+            screen.blit(self.getSquare(Square.HIGHLIGHT), self.getSquareRect(key[1], key[2]))
+        elif kind == "path":
+            # The move path follows the mouse, so it's not worth caching
+            saved = self.board.currentMoveSequence
+            self.board.currentMoveSequence = list(key[1])
+            self.board.drawMovePath(screen)
+            self.board.currentMoveSequence = saved
+        elif kind == "piece":
+            (kind, piece, selectable, chopped, pos) = key
+            screen.blit(self.getSprite(piece, selectable, chopped), self.getSpriteRect(pos))
+        elif kind == "winner":
+            screen.blit(self.board.getWinnerLabel(), (105, 200))
+
+    # Draw the changes since the last frame, and redraw areas (rects) whatever
+    # is in them. Returns the list of areas of the screen that changed.
+    def draw(self, screen, areas=()):
+        items = self.getItems()
+        boardRect = pygame.Rect(0, 0, self.board.boardSize, self.board.boardSize)
+
+        if self.previousItems is None:
+            dirty = [boardRect]
+        else:
+            current = set(key for key, rect in items)
+            dirty = [rect for key, rect in self.previousItems if key not in current]
+            previous = set(key for key, rect in self.previousItems)
+            dirty += [rect for key, rect in items if key not in previous]
+            dirty += [pygame.Rect(area) for area in areas]
+            if len(dirty) > self.MAX_DIRTY_RECTS:
+                dirty = [boardRect]
+        self.previousItems = items
+        if not dirty:
+            return []
+
+        # Redraw the background and every item overlapping each dirty area
+        dirty = [rect.clip(boardRect) for rect in dirty]
+        background = self.getBackground()
+        for area in dirty:
+            screen.set_clip(area)
+            screen.blit(background, area, area)
+            for key, rect in items:
+                if rect.colliderect(area):
+                    self.drawItem(screen, key)
+        screen.set_clip(None)
+        return dirty
@@ -0,0 +1,342 @@
+import struct
+from enum import Enum
+from collections import namedtuple, OrderedDict
+from bitboard import *
+
+#
+# Rules
+#
+# The checkers rules with no dependency on pygame or on any drawing / mouse
+# state, so they can be used headless (simulations, searches, servers...).
+#
+# Positions are immutable and moves are complete: a multi-jump is a single
+# move holding every square visited and every piece captured.
+#
+
+class Player(Enum):
+    NONE       = 0
+    ONE        = 1
+    ONE_KING   = 2
+    TWO        = 3
+    TWO_KING   = 4
+
+# Multipliers for mixing a position's bitboards into its hash
+HASH_WHITE = 0x9E3779B97F4A7C15
+HASH_YELLOW = 0xC2B2AE3D27D4EB4F
+HASH_KINGS = 0x165667B19E3779F9
+HASH_MASK = 0xFFFFFFFFFFFFFFFF
+
+# Size of a position written as bytes: the three bitboards and the player to move
+POSITION_FORMAT = struct.Struct("<IIIB")
+POSITION_BYTES = POSITION_FORMAT.size
+
+#
+# Position Class
+#
+# A position on the board. white/yellow/kings are bitboards (see bitboard.py)
+# and player is whose turn it is (Player.ONE or Player.TWO). Positions are
+# values: they are never changed once made, compare equal when their pieces
+# and player are, and keep a 64-bit hash worked out when they are made.
+# Setting a field raises AttributeError, as it would leave the hash stale.
+#
+class Position(object):
+    __slots__ = ('white', 'yellow', 'kings', 'player', 'hash')
+
+    def __init__(self, white, yellow, kings, player):
+        setField = object.__setattr__
+        setField(self, 'white', white)
+        setField(self, 'yellow', yellow)
+        setField(self, 'kings', kings)
+        setField(self, 'player', player)
+        key = (white * HASH_WHITE ^ yellow * HASH_YELLOW ^ kings * HASH_KINGS ^ (player is Player.ONE)) & HASH_MASK
+        setField(self, 'hash', key ^ (key >> 31))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Position objects can't be changed")
+
+    def __delattr__(self, name):
+        raise AttributeError("Position objects can't be changed")
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        return (self.__class__ is other.__class__ and self.hash == other.hash and self.white == other.white and
+                self.yellow == other.yellow and self.kings == other.kings and self.player is other.player)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "Position(white=%#x, yellow=%#x, kings=%#x, player=%s)" % (self.white, self.yellow, self.kings, self.player)
+
+    # Positions are made again from their fields, so they can be sent to other processes
+    def __reduce__(self):
+        return (Position, (self.white, self.yellow, self.kings, self.player))
+
+    # The same position with the colours swapped: the board turned around and
+    # each side's pieces given to the other. The game is the same from there.
+    def flipColors(self):
+        return Position(rotateBoard(self.yellow), rotateBoard(self.white), rotateBoard(self.kings), getOpponent(self.player))
+
+    # The one of this position and its colour flip with Player.ONE to move, so
+    # positions that are the same game with the colours swapped are equal
+    def getCanonical(self):
+        if self.player is Player.ONE:
+            return self
+        return self.flipColors()
+
+    # The position as POSITION_BYTES bytes
+    def toBytes(self):
+        return POSITION_FORMAT.pack(self.white, self.yellow, self.kings, self.player.value)
+
+    @staticmethod
+    def fromBytes(data):
+        white, yellow, kings, player = POSITION_FORMAT.unpack(data)
+        return Position(white, yellow, kings, Player(player))
+
+# A complete move. path is the tuple of squares visited, starting with the square
+# the piece moves from, and captures is the bitboard of the pieces it jumps.
+Move = namedtuple('Move', ['path', 'captures'])
+
+# What it takes to take a move back (see unmakeMove). origin and target are the
+# squares the piece moved from and to, captures and capturedKings are bitboards
+# of the pieces it jumped and which of those were kings, and promoted is whether
+# the piece was crowned.
+Undo = namedtuple('Undo', ['origin', 'target', 'captures', 'capturedKings', 'promoted'])
+
+#
+# Helper Functions
+#
+def isPlayersPiece(player, piece):
+    return (isPlayerOne(player) and isPlayerOne(piece)) or (isPlayerTwo(player) and isPlayerTwo(piece))
+
+def selfOrNone(piece, pieceInQuestion):
+    if pieceInQuestion is Player.NONE: return True
+    return isPlayersPiece(piece, pieceInQuestion)
+
+def isPlayerOne(player):
+    return player is Player.ONE or player is Player.ONE_KING
+
+def isPlayerTwo(player):
+    return player is Player.TWO or player is Player.TWO_KING
+
+def getOpponent(player):
+    if isPlayerOne(player): return Player.TWO
+    return Player.ONE
+
+def areOpponents(x,y):
+    return (isPlayerOne(x) and isPlayerTwo(y)) or (isPlayerTwo(x) and isPlayerOne(y))
+
+def isKing(player):
+    if player is Player.ONE_KING or player is Player.TWO_KING: return True
+    return False
+
+def getKing(piece):
+    if isPlayerOne(piece):
+        return Player.ONE_KING
+    if isPlayerTwo(piece):
+        return Player.TWO_KING
+    return Player.NONE
+
+# The directions a non-king piece of this player moves in
+def getForward(player):
+    if isPlayerOne(player): return DOWN
+    if isPlayerTwo(player): return UP
+    return ()
+
+# Whether or not a piece arriving on this row should be crowned
+def shouldPromoteToKing(row, piece):
+    if isPlayerOne(piece) and row == 7:
+        return True
+    if isPlayerTwo(piece) and row == 0:
+        return True
+    return False
+
+#
+# Positions
+#
+
+# The position at the start of a game. Player one fills the first three rows,
+# player two the last three, and player two moves first.
+def startingPosition():
+    return Position(ROWS[0] | ROWS[1] | ROWS[2], ROWS[5] | ROWS[6] | ROWS[7], 0, Player.TWO)
+
+# Return the bitboards of the given player's pieces and their opponent's pieces
+def getSides(position, player=None):
+    if player is None: player = position.player
+    if player is Player.ONE: return (position.white, position.yellow)
+    if player is Player.TWO: return (position.yellow, position.white)
+    if isPlayerOne(player):
+        return (position.white, position.yellow)
+    if isPlayerTwo(player):
+        return (position.yellow, position.white)
+    return (0, 0)
+
+# Bitboard of the empty squares
+def getEmpty(position):
+    return FULL & ~(position.white | position.yellow)
+
+# Get the piece at the board index (x,y)
+def getPiece(position, x, y):
+    bit = BIT_AT[y][x]
+    if position.white & bit:
+        return Player.ONE_KING if position.kings & bit else Player.ONE
+    if position.yellow & bit:
+        return Player.TWO_KING if position.kings & bit else Player.TWO
+    return Player.NONE
+
+# Return the number of pieces the given player has on the board
+def countPieces(position, player):
+    return popCount(getSides(position, player)[0])
+
+# Bitboard of the pieces the player to move can capture with
+def getJumpingPieces(position):
+    own, opponents = getSides(position)
+    return getJumpers(own, position.kings, getForward(position.player), opponents, getEmpty(position))
+
+# Bitboard of the pieces the player to move can make a quiet move with
+def getMovingPieces(position):
+    own, opponents = getSides(position)
+    return getMovers(own, position.kings, getForward(position.player), getEmpty(position))
+
+# Bitboard of the pieces the player to move can start a legal move with.
+# Captures are compulsory, so if any piece can jump only the jumpers count.
+def getSelectable(position):
+    return getJumpingPieces(position) or getMovingPieces(position)
+
+#
+# Move generation
+#
+
+# Return every legal move for the player to move
+def legalMoves(position):
+    if position.player is Player.ONE:
+        own, opponents, forward = position.white, position.yellow, DOWN
+    else:
+        own, opponents, forward = position.yellow, position.white, UP
+    kings = position.kings
+    empty = FULL & ~(own | opponents)
+
+    # Captures are compulsory, and must be followed through to the end
+    jumpers = getJumpers(own, kings, forward, opponents, empty)
+    if jumpers:
+        moves = []
+        for square in iterSquares(jumpers):
+            bit = 1 << square
+            directions = getDirections(forward, kings & bit)
+            # The jumping piece has left its square, so it may land back on it
+            addJumps(square, directions, opponents, empty | bit, (square,), 0, moves)
+        return moves
+
+    # Otherwise every piece that can step into an empty square. The shifts
+    # are done a whole side at a time, so each target square gives its source.
+    moves = []
+    for direction in ALL_DIRECTIONS:
+        movable = own if direction in forward else own & kings
+        if not movable: continue
+        for mask, shift in STEPS[direction]:
+            if shift > 0:
+                targets = ((movable & mask) << shift) & empty
+            else:
+                targets = ((movable & mask) >> -shift) & empty
+            while targets:
+                bit = targets & -targets
+                target = bit.bit_length() - 1
+                moves.append(Move((target - shift, target), 0))
+                targets ^= bit
+    return moves
+
+# Recursively follow every jump sequence from a square, appending finished moves
+def addJumps(square, directions, opponents, empty, path, captures, moves):
+    bit = 1 << square
+    extended = False
+    for direction in directions:
+        middle = NEIGHBOURS[direction][bit]
+        if middle & opponents and not middle & captures:
+            landing = JUMPS[direction][bit]
+            if landing & empty:
+                extended = True
+                target = landing.bit_length() - 1
+                addJumps(target, directions, opponents, empty, path + (target,), captures | middle, moves)
+    if not extended and captures:
+        moves.append(Move(path, captures))
+
+# Move lists of recently seen positions, so positions that come up again (in a
+# search, or frame after frame in the GUI) don't have their jump trees worked
+# out again. Once full, the least recently used position is forgotten.
+class MoveListCache(object):
+    def __init__(self, size=65536):
+        self.size = size
+        self.moves = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # The legal moves of the position, as a tuple (it's shared, so it mustn't change)
+    def get(self, position):
+        moves = self.moves.get(position)
+        if moves is not None:
+            self.hits += 1
+            self.moves.move_to_end(position)
+            return moves
+        self.misses += 1
+        moves = tuple(legalMoves(position))
+        self.moves[position] = moves
+        if len(self.moves) > self.size:
+            self.moves.popitem(last=False)
+        return moves
+
+    def clear(self):
+        self.moves.clear()
+
+moveListCache = MoveListCache()
+
+# Return every legal move for the player to move, from the shared move list cache
+def cachedLegalMoves(position):
+    return moveListCache.get(position)
+
+# Return the position after the player to move plays the move
+def applyMove(position, move):
+    source = 1 << move.path[0]
+    target = 1 << move.path[-1]
+    captures = move.captures
+    kings = position.kings & ~captures
+    if kings & source:
+        kings = (kings & ~source) | target
+    elif position.player is Player.ONE:
+        kings |= target & ROWS[7]
+    else:
+        kings |= target & ROWS[0]
+
+    if position.player is Player.ONE:
+        return Position((position.white & ~source) | target, position.yellow & ~captures, kings, Player.TWO)
+    return Position(position.white & ~captures, (position.yellow & ~source) | target, kings, Player.ONE)
+
+# Play a move. Returns the new position and the Undo record that takes it back.
+def makeMove(position, move):
+    newPosition = applyMove(position, move)
+    origin = move.path[0]
+    target = move.path[-1]
+    promoted = not position.kings & (1 << origin) and bool(newPosition.kings & (1 << target))
+    return (newPosition, Undo(origin, target, move.captures, position.kings & move.captures, promoted))
+
+# Take back the move that led to the position, given its Undo record.
+# Returns the position before the move.
+def unmakeMove(position, undo):
+    source = 1 << undo.origin
+    target = 1 << undo.target
+    kings = (position.kings & ~target) | undo.capturedKings
+    if position.kings & target and not undo.promoted:
+        kings |= source
+
+    # The player who made the move is the one not to move now
+    if position.player is Player.TWO:
+        return Position((position.white & ~target) | source, position.yellow | undo.captures, kings, Player.ONE)
+    return Position(position.white | undo.captures, (position.yellow & ~target) | source, kings, Player.TWO)
+
+# The winner of the position, or None if the game isn't over.
+# A player with no pieces or no legal moves has lost.
+def result(position):
+    if getSelectable(position):
+        return None
+    return getOpponent(position.player)
@@ -0,0 +1,45 @@
+import time
+import pygame
+
+#
+# FrameScheduler Class
+#
+# Decides when the game loop runs. While something is moving on screen (a
+# piece being dragged or snapping into place) frames are ticked at a capped
+# frame rate. Otherwise the loop sleeps in pygame.event.wait until the next
+# event arrives, so an idle board uses no CPU.
+#
+class FrameScheduler(object):
+    def __init__(self, maxFps=60):
+        self.maxFps = maxFps
+        self.clock = pygame.time.Clock()
+
+        # Milliseconds between the last two ticked frames, and milliseconds
+        # the last frame spent working (between getting its events and the
+        # next call to getEvents)
+        self.frameTime = 0
+        self.workTime = 0
+        self.lastFrameStart = None
+
+    # Wait until the next frame should run and return the events for it.
+    # animating says whether something on screen is moving.
+    def getEvents(self, animating):
+        if self.lastFrameStart is not None:
+            self.workTime = (time.time() - self.lastFrameStart) * 1000.0
+
+        if animating:
+            self.frameTime = self.clock.tick(self.maxFps)
+            events = pygame.event.get()
+        else:
+            events = [pygame.event.wait()] + pygame.event.get()
+            # Don't count the time spent asleep as the next frame's frame time
+            self.clock.tick()
+            self.frameTime = 0
+
+        self.lastFrameStart = time.time()
+        return events
+
+    # Frames per second the last ticked frame was running at
+    def getFps(self):
+        if self.frameTime == 0: return 0.0
+        return 1000.0 / self.frameTime
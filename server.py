@@ -0,0 +1,293 @@
+#!/usr/local/bin/python3
+#
+# Checkers game server
+#
+# Hosts any number of games at once over TCP using asyncio. A game is only
+# its GameHistory (see history.py) and the connections in its seats, so it
+# costs the same however many other games are running.
+#
+# Clients and the server send each other one JSON object per line. Moves are
+# written in PDN (see pdn.py), and black (who moves first) is Player.TWO.
+#
+# Client to server:
+#   {"type": "join"}                                 take a seat in the next game that has one free
+#   {"type": "join", "game": 12}                     take the free seat in game 12
+#   {"type": "watch", "game": 12}                    be sent game 12's state as it changes
+#   {"type": "move", "game": 12, "move": "11-15"}    play a move
+#   {"type": "resign", "game": 12}
+#   {"type": "stats"}                                ask for the server's statistics
+#
+# Server to client:
+#   {"type": "joined", "game": 12, "color": "black"}
+#   {"type": "state", "game": 12, "fen": "B:W21,...", "started": true, "plies": 0, "last": null, "result": null}
+#   {"type": "stats", "games": 10, "connections": 20, ...}
+#   {"type": "error", "message": "..."}
+#
+# The state is sent to both players and any watchers whenever it changes.
+# Once a game has a result it is removed from the server.
+#
+#   python3 server.py --port 8765
+#
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+from rules import *
+from history import GameHistory
+from pdn import PdnError, parseMove, formatMove, formatFen, formatResult
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+COLORS = {Player.ONE: "white", Player.TWO: "black"}
+
+# Raised when a client asks for something it can't do. The message is sent back to it.
+class RequestError(Exception):
+    pass
+
+#
+# Connection Class
+#
+# One client. Messages are written straight to the socket's buffer, so sending
+# the state to the other players in a game never waits on a slow client.
+#
+class Connection(object):
+    def __init__(self, writer):
+        self.writer = writer
+        # game number -> the seat (player) this client has in it, or None when watching
+        self.games = {}
+
+    def send(self, message):
+        if not self.writer.is_closing():
+            self.writer.write((json.dumps(message) + "\n").encode())
+
+#
+# ServerGame Class
+#
+class ServerGame(object):
+    def __init__(self, number):
+        self.number = number
+        self.history = GameHistory()
+        self.seats = {Player.ONE: None, Player.TWO: None}
+        self.watchers = set()
+        self.started = False
+        self.lastMove = None
+        self.result = None
+
+    # The seat a new player should take, or None if both are taken. Black moves first, so fill it first.
+    def getFreeSeat(self):
+        for player in (Player.TWO, Player.ONE):
+            if self.seats[player] is None:
+                return player
+        return None
+
+    def getState(self):
+        return {"type": "state", "game": self.number, "fen": formatFen(self.history.position),
+                "started": self.started, "plies": len(self.history.played), "last": self.lastMove, "result": self.result}
+
+    # Everyone who should be sent the game's state
+    def getConnections(self):
+        connections = [connection for connection in self.seats.values() if connection is not None]
+        return connections + list(self.watchers)
+
+    def broadcast(self, message):
+        for connection in self.getConnections():
+            connection.send(message)
+
+#
+# GameServer Class
+#
+class GameServer(object):
+    def __init__(self):
+        self.games = {}
+        # Games with a free seat, oldest first (dicts keep their order)
+        self.waiting = {}
+        self.nextGame = 1
+        self.connections = 0
+        self.moves = 0
+        self.moveTime = 0.0
+        self.startTime = time.time()
+
+    # Serve one client until it disconnects
+    async def handleConnection(self, reader, writer):
+        connection = Connection(writer)
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    # The line is longer than the stream's limit, so the rest of it can't be read
+                    connection.send({"type": "error", "message": "message too long"})
+                    await writer.drain()
+                    break
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    if not isinstance(message, dict):
+                        raise RequestError("expected a JSON object")
+                    self.handleMessage(connection, message)
+                except (ValueError, RequestError) as error:
+                    connection.send({"type": "error", "message": str(error)})
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections -= 1
+            self.leave(connection)
+            writer.close()
+
+    def handleMessage(self, connection, message):
+        kind = message.get("type")
+        if kind == "join":
+            self.join(connection, message.get("game"))
+        elif kind == "watch":
+            self.watch(connection, message.get("game"))
+        elif kind == "move":
+            startTime = time.time()
+            self.move(connection, message.get("game"), message.get("move"))
+            self.moveTime += time.time() - startTime
+        elif kind == "resign":
+            self.resign(connection, message.get("game"))
+        elif kind == "stats":
+            connection.send(self.getStats())
+        else:
+            raise RequestError("unknown message type %r" % kind)
+
+    def getGame(self, number):
+        if not isinstance(number, int) or isinstance(number, bool):
+            raise RequestError("game must be a number, not %r" % (number,))
+        game = self.games.get(number)
+        if game is None:
+            raise RequestError("no game %r" % number)
+        return game
+
+    # The seat the connection has in a game, which must be the one to move
+    def getPlayerToMove(self, connection, game):
+        player = connection.games.get(game.number)
+        if player is None:
+            raise RequestError("not playing in game %d" % game.number)
+        if player is not game.history.position.player:
+            raise RequestError("not your turn")
+        return player
+
+    def join(self, connection, number=None):
+        if number is None:
+            if self.waiting:
+                game = next(iter(self.waiting.values()))
+            else:
+                game = ServerGame(self.nextGame)
+                self.nextGame += 1
+                self.games[game.number] = game
+                self.waiting[game.number] = game
+        else:
+            game = self.getGame(number)
+        if game.number in connection.games:
+            raise RequestError("already in game %d" % game.number)
+        player = game.getFreeSeat()
+        if player is None:
+            raise RequestError("game %d is full" % game.number)
+
+        game.seats[player] = connection
+        connection.games[game.number] = player
+        if game.getFreeSeat() is None:
+            game.started = True
+            self.waiting.pop(game.number, None)
+        connection.send({"type": "joined", "game": game.number, "color": COLORS[player]})
+        game.broadcast(game.getState())
+
+    def watch(self, connection, number):
+        game = self.getGame(number)
+        if game.number in connection.games:
+            raise RequestError("already in game %d" % game.number)
+        game.watchers.add(connection)
+        connection.games[game.number] = None
+        connection.send(game.getState())
+
+    def move(self, connection, number, text):
+        game = self.getGame(number)
+        self.getPlayerToMove(connection, game)
+        if not game.started:
+            raise RequestError("waiting for an opponent")
+        try:
+            move = parseMove(game.history.position, str(text))
+        except PdnError as error:
+            raise RequestError(str(error))
+
+        game.history.makeMove(move)
+        game.lastMove = formatMove(move)
+        self.moves += 1
+        winner = result(game.history.position)
+        if winner is not None:
+            game.result = formatResult(winner)
+        game.broadcast(game.getState())
+        if game.result is not None:
+            self.endGame(game)
+
+    def resign(self, connection, number):
+        game = self.getGame(number)
+        player = connection.games.get(game.number)
+        if player is None:
+            raise RequestError("not playing in game %d" % game.number)
+        game.result = formatResult(getOpponent(player))
+        game.broadcast(game.getState())
+        self.endGame(game)
+
+    # A client disconnected. Anyone playing loses the games they were in.
+    def leave(self, connection):
+        for number, player in list(connection.games.items()):
+            game = self.games.get(number)
+            if game is None: continue
+            if player is None:
+                game.watchers.discard(connection)
+            elif not game.started:
+                # Nobody else had joined, so the game never started
+                self.endGame(game)
+            else:
+                game.seats[player] = None
+                game.result = formatResult(getOpponent(player))
+                game.broadcast(game.getState())
+                self.endGame(game)
+        connection.games.clear()
+
+    # Forget a finished (or abandoned) game
+    def endGame(self, game):
+        self.games.pop(game.number, None)
+        self.waiting.pop(game.number, None)
+        for connection in game.getConnections():
+            connection.games.pop(game.number, None)
+
+    def getStats(self):
+        elapsed = max(time.time() - self.startTime, 1e-9)
+        stats = {"type": "stats", "games": len(self.games), "waiting": len(self.waiting),
+                 "connections": self.connections, "moves": self.moves, "movesPerSecond": round(self.moves / elapsed, 1),
+                 "microsecondsPerMove": round(self.moveTime * 1e6 / max(self.moves, 1), 1)}
+        if resource is not None:
+            # ru_maxrss is in kilobytes on Linux and bytes on macOS
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            stats["maxRssMegabytes"] = round(maxrss / (1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0), 1)
+        return stats
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handleConnection, host, port, limit=1 << 16, backlog=4096)
+        async with server:
+            await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host checkers games over TCP.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on (default: 8765)")
+    args = parser.parse_args(argv)
+    print("Serving on %s:%d" % (args.host, args.port))
+    try:
+        asyncio.run(GameServer().serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
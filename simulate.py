@@ -0,0 +1,97 @@
+#!/usr/local/bin/python3
+#
+# Batch self-play simulator
+#
+# Plays lots of complete games headlessly across a pool of processes and
+# streams the results to a file as the games finish. One line per game:
+#
+#   <game number> <winner: W, Y or D for a draw> <plies> <moves...>
+#
+# Moves are the squares (0-31, see bitboard.py) the piece visits, joined by
+# '-' for a quiet move or 'x' for a capture.
+#
+# Usage: python3 simulate.py 1000 --white random --yellow engine --workers 8
+#
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from rules import *
+from players import *
+
+# Text for a move in the results file
+def getMoveText(move):
+    separator = "x" if move.captures else "-"
+    return separator.join(str(square) for square in move.path)
+
+# Text for the winner in the results file
+def getWinnerText(winner):
+    if winner is Player.ONE: return "W"
+    if winner is Player.TWO: return "Y"
+    return "D"
+
+# Play a chunk of games in a worker process.
+# Returns the result lines, the number of moves played, the worker's process
+# id and how long the worker was busy.
+def playGames(firstGame, numGames, whiteName, yellowName, seed, timeLimit, maxDepth, maxPlies):
+    startTime = time.time()
+    lines = []
+    numMoves = 0
+    for gameNumber in range(firstGame, firstGame + numGames):
+        gameSeed = (seed, gameNumber)
+        white = createPlayer(whiteName, str(gameSeed) + "W", timeLimit, maxDepth)
+        yellow = createPlayer(yellowName, str(gameSeed) + "Y", timeLimit, maxDepth)
+        winner, moves = playGame(white, yellow, maxPlies)
+        numMoves += len(moves)
+        lines.append("%d %s %d %s\n" % (gameNumber, getWinnerText(winner), len(moves), " ".join(getMoveText(move) for move in moves)))
+    return (lines, numMoves, os.getpid(), time.time() - startTime)
+
+# Parse the command line
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(description="Play checkers games headlessly across several processes.")
+    parser.add_argument("games", type=int, help="number of games to play")
+    parser.add_argument("--white", choices=PLAYER_NAMES, default="random", help="player for white (default: random)")
+    parser.add_argument("--yellow", choices=PLAYER_NAMES, default="random", help="player for yellow (default: random)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes (default: one per core)")
+    parser.add_argument("--chunk", type=int, default=0, help="games per task (default: picked from games and workers)")
+    parser.add_argument("--output", default="results.txt", help="file to write results to (default: results.txt)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    parser.add_argument("--time", type=float, default=0.05, help="engine seconds per move (default: 0.05)")
+    parser.add_argument("--depth", type=int, default=64, help="engine maximum search depth (default: 64)")
+    parser.add_argument("--max-plies", type=int, default=200, help="plies before a game is called a draw (default: 200)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parseArguments(argv)
+    workers = max(1, args.workers or 1)
+
+    # Enough tasks per worker to keep them all busy to the end, but few enough
+    # that sending results back is cheap compared to playing the games
+    chunk = args.chunk or max(1, min(100, args.games // (workers * 8)))
+
+    startTime = time.time()
+    numGames = 0
+    numMoves = 0
+    busyTimes = {}
+    with open(args.output, "w") as output, ProcessPoolExecutor(max_workers=workers) as pool:
+        tasks = [pool.submit(playGames, first, min(chunk, args.games - first), args.white, args.yellow,
+                             args.seed, args.time, args.depth, args.max_plies)
+                 for first in range(0, args.games, chunk)]
+        for task in as_completed(tasks):
+            lines, moves, pid, busy = task.result()
+            output.writelines(lines)
+            output.flush()
+            numGames += len(lines)
+            numMoves += moves
+            busyTimes[pid] = busyTimes.get(pid, 0.0) + busy
+    elapsed = time.time() - startTime
+
+    print("%d games, %d moves in %.2fs" % (numGames, numMoves, elapsed))
+    print("%.1f games/sec, %.1f moves/sec" % (numGames / elapsed, numMoves / elapsed))
+    for number, pid in enumerate(sorted(busyTimes)):
+        print("worker %d (pid %d): %.0f%% busy" % (number, pid, 100.0 * busyTimes[pid] / elapsed))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,418 @@
+#!/usr/local/bin/python3
+#
+# Endgame tablebase
+#
+# Solves every position with up to N pieces by retrograde analysis, storing
+# for each one whether the player to move wins, loses or draws, and in how
+# many plies the game is won.
+#
+# Positions are grouped into slices by their material (white men, white
+# kings, yellow men, yellow kings). Captures and promotions always lead to a
+# smaller or already solved slice, so slices are solved in order and slices
+# that don't depend on each other are solved in parallel. Each finished slice
+# is written to its own file, so an interrupted build picks up where it left
+# off. The slices are then merged into one indexed file which lookups mmap:
+#
+#   python3 tablebase.py build --pieces 6 --workers 8
+#
+# Merged file layout (little endian):
+#   "CKTB" magic, uint32 number of slices
+#   per slice: 4 x uint8 material, uint64 offset of its data, uint64 entries
+#   per slice: one uint16 per entry, white to move entries then yellow to move
+#
+
+import os
+import sys
+import mmap
+import time
+import array
+import struct
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from rules import *
+
+# Results, from the point of view of the player to move
+WIN = "win"
+LOSS = "loss"
+DRAW = "draw"
+
+# Entry encoding: the top two bits are the result, the rest the distance in plies
+ENTRY_DRAW = 0x0000
+ENTRY_WIN = 0x4000
+ENTRY_LOSS = 0x8000
+ENTRY_INVALID = 0xC000
+RESULT_MASK = 0xC000
+DISTANCE_MASK = 0x3FFF
+
+MAGIC = b"CKTB"
+HEADER = struct.Struct("<4sI")
+SLICE_HEADER = struct.Struct("<4BQQ")
+ENTRY = struct.Struct("<H")
+
+# Men can never stand on the row they would be crowned on
+WHITE_MEN_SQUARES = FULL & ~ROWS[7]
+YELLOW_MEN_SQUARES = FULL & ~ROWS[0]
+
+# Binomial coefficients for ranking sets of squares
+BINOMIAL = [[0] * 34 for n in range(34)]
+for n in range(34):
+    BINOMIAL[n][0] = 1
+    for k in range(1, n + 1):
+        BINOMIAL[n][k] = BINOMIAL[n-1][k-1] + BINOMIAL[n-1][k]
+
+#
+# Indexing
+#
+
+# Material of a position: (white men, white kings, yellow men, yellow kings)
+def getMaterial(position):
+    kings = position.kings
+    return (popCount(position.white & ~kings), popCount(position.white & kings),
+            popCount(position.yellow & ~kings), popCount(position.yellow & kings))
+
+# Number of placements of the pieces in a slice (for one player to move)
+def getSliceSize(material):
+    whiteMen, whiteKings, yellowMen, yellowKings = material
+    free = 32 - whiteMen - yellowMen
+    return (BINOMIAL[28][whiteMen] * BINOMIAL[32 - whiteMen][yellowMen] *
+            BINOMIAL[free][whiteKings] * BINOMIAL[free - whiteKings][yellowKings])
+
+# Rank the pieces of a bitboard among the squares in free (combinatorial number system)
+def rankSquares(bitboard, free):
+    rank = 0
+    count = 1
+    for square in iterSquares(bitboard):
+        rank += BINOMIAL[popCount(free & ((1 << square) - 1))][count]
+        count += 1
+    return rank
+
+# Inverse of rankSquares
+def unrankSquares(rank, count, free):
+    bitboard = 0
+    for piece in range(count, 0, -1):
+        index = piece - 1
+        while BINOMIAL[index + 1][piece] <= rank:
+            index += 1
+        rank -= BINOMIAL[index][piece]
+        # The index'th square of free
+        remaining = free
+        for skip in range(index):
+            remaining &= remaining - 1
+        bitboard |= remaining & -remaining
+    return bitboard
+
+# Index of a position within its slice. White to move entries come first.
+def getIndex(position, material):
+    whiteMen, whiteKings, yellowMen, yellowKings = material
+    kings = position.kings
+    whiteMenBits = position.white & ~kings
+    yellowMenBits = position.yellow & ~kings
+    whiteKingBits = position.white & kings
+
+    index = rankSquares(whiteMenBits, WHITE_MEN_SQUARES)
+    free = FULL & ~whiteMenBits
+    index = index * BINOMIAL[32 - whiteMen][yellowMen] + rankSquares(yellowMenBits, free)
+    free &= ~yellowMenBits
+    freeCount = 32 - whiteMen - yellowMen
+    index = index * BINOMIAL[freeCount][whiteKings] + rankSquares(whiteKingBits, free)
+    free &= ~whiteKingBits
+    index = index * BINOMIAL[freeCount - whiteKings][yellowKings] + rankSquares(position.yellow & kings, free)
+
+    if position.player is Player.TWO:
+        index += getSliceSize(material)
+    return index
+
+# Position at an index of a slice, or None if the index isn't a legal position
+def getPosition(index, material):
+    whiteMen, whiteKings, yellowMen, yellowKings = material
+    size = getSliceSize(material)
+    player = Player.ONE
+    if index >= size:
+        index -= size
+        player = Player.TWO
+
+    freeCount = 32 - whiteMen - yellowMen
+    index, yellowKingRank = divmod(index, BINOMIAL[freeCount - whiteKings][yellowKings])
+    index, whiteKingRank = divmod(index, BINOMIAL[freeCount][whiteKings])
+    whiteMenRank, yellowMenRank = divmod(index, BINOMIAL[32 - whiteMen][yellowMen])
+
+    whiteMenBits = unrankSquares(whiteMenRank, whiteMen, WHITE_MEN_SQUARES)
+    free = FULL & ~whiteMenBits
+    yellowMenBits = unrankSquares(yellowMenRank, yellowMen, free)
+    if yellowMenBits & ~YELLOW_MEN_SQUARES:
+        return None
+    free &= ~yellowMenBits
+    whiteKingBits = unrankSquares(whiteKingRank, whiteKings, free)
+    free &= ~whiteKingBits
+    yellowKingBits = unrankSquares(yellowKingRank, yellowKings, free)
+    return Position(whiteMenBits | whiteKingBits, yellowMenBits | yellowKingBits, whiteKingBits | yellowKingBits, player)
+
+# Every slice with up to maxPieces pieces, in an order where each slice only
+# depends on slices before it. Returns a list of groups of independent slices.
+def getSliceGroups(maxPieces):
+    groups = {}
+    for whiteMen in range(maxPieces + 1):
+        for whiteKings in range(maxPieces + 1 - whiteMen):
+            for yellowMen in range(maxPieces + 1 - whiteMen - whiteKings):
+                for yellowKings in range(maxPieces + 1 - whiteMen - whiteKings - yellowMen):
+                    if whiteMen + whiteKings == 0 or yellowMen + yellowKings == 0: continue
+                    # Captures remove pieces and promotions turn men into kings
+                    total = whiteMen + whiteKings + yellowMen + yellowKings
+                    groups.setdefault((total, whiteMen + yellowMen), []).append((whiteMen, whiteKings, yellowMen, yellowKings))
+    return [groups[key] for key in sorted(groups)]
+
+# File name of a solved slice in the working directory
+def getSliceFileName(material):
+    return "%d-%d-%d-%d.bin" % material
+
+# Decode an entry into (result, distance)
+def decodeEntry(entry):
+    kind = entry & RESULT_MASK
+    if kind == ENTRY_WIN: return (WIN, entry & DISTANCE_MASK)
+    if kind == ENTRY_LOSS: return (LOSS, entry & DISTANCE_MASK)
+    return (DRAW, 0)
+
+#
+# Tablebase Class
+#
+# Lookups into a merged tablebase file, or into a directory of slice files
+# while it is being built. The files are memory mapped, so every process
+# shares the same copy in the page cache and entries are read in place.
+#
+class Tablebase(object):
+    def __init__(self, path):
+        self.maps = []
+        self.slices = {}
+        if os.path.isdir(path):
+            for name in os.listdir(path):
+                if not name.endswith(".bin"): continue
+                material = tuple(int(count) for count in name[:-4].split("-"))
+                self.slices[material] = (self.openMap(os.path.join(path, name)), 0)
+        else:
+            data = self.openMap(path)
+            magic, numSlices = HEADER.unpack_from(data, 0)
+            if magic != MAGIC:
+                raise ValueError("%s is not a tablebase file" % path)
+            for number in range(numSlices):
+                whiteMen, whiteKings, yellowMen, yellowKings, offset, entries = SLICE_HEADER.unpack_from(data, HEADER.size + number * SLICE_HEADER.size)
+                self.slices[(whiteMen, whiteKings, yellowMen, yellowKings)] = (data, offset)
+        self.maxPieces = max([sum(material) for material in self.slices] or [0])
+
+    # Memory map a file read only
+    def openMap(self, path):
+        with open(path, "rb") as tableFile:
+            data = mmap.mmap(tableFile.fileno(), 0, access=mmap.ACCESS_READ)
+        self.maps.append(data)
+        return data
+
+    # Whether the position's material is in the tablebase
+    def contains(self, position):
+        return getMaterial(position) in self.slices
+
+    # Raw entry for a position, or None if it isn't in the tablebase
+    def getEntry(self, position):
+        material = getMaterial(position)
+        if material[0] + material[1] == 0 or material[2] + material[3] == 0:
+            # No pieces left for one side. Only the player to move can have run out.
+            return ENTRY_LOSS
+        found = self.slices.get(material)
+        if found is None:
+            return None
+        data, offset = found
+        return ENTRY.unpack_from(data, offset + ENTRY.size * getIndex(position, material))[0]
+
+    # (result, distance to the end of the game in plies) for the player to
+    # move, or None if the position isn't in the tablebase
+    def probe(self, position):
+        entry = self.getEntry(position)
+        if entry is None:
+            return None
+        return decodeEntry(entry)
+
+    def close(self):
+        for data in self.maps:
+            data.close()
+        self.maps = []
+        self.slices = {}
+
+#
+# Solving
+#
+
+# Bitboard of the squares the player's pieces can have just stepped from to
+# reach the square (a quiet move that didn't promote)
+def getUnmoveSources(position, square, player):
+    bit = 1 << square
+    if position.kings & bit:
+        directions = ALL_DIRECTIONS
+    elif bit & (ROWS[7] if player is Player.ONE else ROWS[0]):
+        return 0
+    else:
+        directions = getForward(player)
+    empty = getEmpty(position)
+    sources = 0
+    for direction in directions:
+        sources |= NEIGHBOURS[OPPOSITE[direction]][bit] & empty
+    return sources
+
+# Indices of the positions in the same slice that can reach this one with a quiet move
+def getPredecessors(position, material):
+    mover = getOpponent(position.player)
+    own = getSides(position, mover)[0]
+    predecessors = []
+    for square in iterSquares(own):
+        for source in iterSquares(getUnmoveSources(position, square, mover)):
+            target = 1 << square
+            moved = 1 << source
+            king = moved if position.kings & target else 0
+            if mover is Player.ONE:
+                previous = Position((position.white & ~target) | moved, position.yellow, (position.kings & ~target) | king, mover)
+            else:
+                previous = Position(position.white, (position.yellow & ~target) | moved, (position.kings & ~target) | king, mover)
+            predecessors.append(getIndex(previous, material))
+    return predecessors
+
+# Work out a position's entry from its children, as far as is known.
+# Returns the new entry, or None if it can't be decided by this distance.
+def evaluateEntry(position, material, values, tablebase, distance):
+    bestWin = None
+    worstLoss = 0
+    allLost = True
+    for move in legalMoves(position):
+        child = applyMove(position, move)
+        if move.captures or getMaterial(child) != material:
+            entry = tablebase.getEntry(child)
+        else:
+            entry = values[getIndex(child, material)]
+        kind = entry & RESULT_MASK
+        if kind == ENTRY_LOSS:
+            childDistance = (entry & DISTANCE_MASK) + 1
+            if bestWin is None or childDistance < bestWin:
+                bestWin = childDistance
+        elif kind == ENTRY_WIN:
+            worstLoss = max(worstLoss, (entry & DISTANCE_MASK) + 1)
+        else:
+            allLost = False
+    if bestWin is not None and bestWin <= distance:
+        return ENTRY_WIN | bestWin
+    if allLost and bestWin is None and worstLoss <= distance:
+        return ENTRY_LOSS | worstLoss
+    return None
+
+# Solve one slice and write it to the working directory. Returns the
+# material, the number of positions and how long it took.
+def solveSlice(material, directory):
+    startTime = time.time()
+    tablebase = Tablebase(directory)
+    size = getSliceSize(material)
+    values = array.array("H", [ENTRY_DRAW]) * (2 * size)
+
+    # First pass: lost positions (no moves) and the distances at which moves
+    # out of the slice (captures and promotions) decide something
+    resolved = []
+    events = {}
+    for index in range(2 * size):
+        position = getPosition(index, material)
+        if position is None:
+            values[index] = ENTRY_INVALID
+            continue
+        moves = legalMoves(position)
+        if not moves:
+            values[index] = ENTRY_LOSS
+            resolved.append(index)
+            continue
+        for move in moves:
+            child = applyMove(position, move)
+            if move.captures or getMaterial(child) != material:
+                entry = tablebase.getEntry(child)
+                if entry & RESULT_MASK in (ENTRY_WIN, ENTRY_LOSS):
+                    events.setdefault((entry & DISTANCE_MASK) + 1, set()).add(index)
+
+    # Then one distance at a time: a position can only be decided at the
+    # distance after one of its children was
+    distance = 1
+    while True:
+        candidates = events.pop(distance, set())
+        for index in resolved:
+            candidates.update(getPredecessors(getPosition(index, material), material))
+        if not candidates:
+            if not events: break
+            distance = min(events)
+            resolved = []
+            continue
+        resolved = []
+        for index in candidates:
+            if values[index] != ENTRY_DRAW: continue
+            entry = evaluateEntry(getPosition(index, material), material, values, tablebase, distance)
+            if entry is not None:
+                values[index] = entry
+                resolved.append(index)
+        distance += 1
+    tablebase.close()
+
+    # Everything left undecided is a draw. Write to a temporary file first so
+    # a half written slice is never mistaken for a finished one.
+    path = os.path.join(directory, getSliceFileName(material))
+    if sys.byteorder != "little":
+        values.byteswap()
+    with open(path + ".tmp", "wb") as sliceFile:
+        values.tofile(sliceFile)
+    os.replace(path + ".tmp", path)
+    return (material, size, time.time() - startTime)
+
+# Merge the slice files into one tablebase file
+def mergeSlices(directory, groups, output):
+    slices = [material for group in groups for material in group]
+    offset = HEADER.size + SLICE_HEADER.size * len(slices)
+    with open(output + ".tmp", "wb") as outputFile:
+        outputFile.write(HEADER.pack(MAGIC, len(slices)))
+        for material in slices:
+            entries = 2 * getSliceSize(material)
+            outputFile.write(SLICE_HEADER.pack(material[0], material[1], material[2], material[3], offset, entries))
+            offset += ENTRY.size * entries
+        for material in slices:
+            with open(os.path.join(directory, getSliceFileName(material)), "rb") as sliceFile:
+                outputFile.write(sliceFile.read())
+    os.replace(output + ".tmp", output)
+
+# Build the tablebase, skipping slices that are already solved
+def build(maxPieces, directory, output, workers):
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    groups = getSliceGroups(maxPieces)
+    startTime = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for group in groups:
+            todo = [material for material in group if not os.path.exists(os.path.join(directory, getSliceFileName(material)))]
+            # Bigger slices first so they don't hold up the end of the group
+            todo.sort(key=getSliceSize, reverse=True)
+            for material, size, elapsed in pool.map(solveSlice, todo, [directory] * len(todo)):
+                print("solved %d-%d-%d-%d: %d positions in %.1fs" % (material + (2 * size, elapsed)))
+                sys.stdout.flush()
+    mergeSlices(directory, groups, output)
+    print("wrote %s in %.1fs" % (output, time.time() - startTime))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build an endgame tablebase.")
+    subcommands = parser.add_subparsers(dest="command")
+    buildParser = subcommands.add_parser("build", help="solve all positions with up to N pieces")
+    buildParser.add_argument("--pieces", type=int, default=6, help="maximum number of pieces (default: 6)")
+    buildParser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (default: one per core)")
+    buildParser.add_argument("--dir", default="tablebase", help="working directory for solved slices (default: tablebase)")
+    buildParser.add_argument("--output", default="tablebase.cktb", help="merged tablebase file (default: tablebase.cktb)")
+    infoParser = subcommands.add_parser("info", help="summarise a tablebase file")
+    infoParser.add_argument("file", nargs="?", default="tablebase.cktb")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        build(args.pieces, args.dir, args.output, args.workers)
+    elif args.command == "info":
+        tablebase = Tablebase(args.file)
+        for material in sorted(tablebase.slices, key=lambda material: (sum(material), material)):
+            print("%d-%d-%d-%d: %d positions" % (material + (2 * getSliceSize(material),)))
+        tablebase.close()
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+#!/usr/local/bin/python3
+#
+# Engine tournaments
+#
+# Plays matches between engine configurations across a pool of processes and
+# estimates their strength difference in Elo. Every opening is played twice
+# with the colours swapped, so neither side gets the luck of the opening.
+#
+# An engine is given as name:key=value,... with the keys
+#
+#   depth     maximum search depth (default: 64)
+#   time      seconds per move (default: 0.1)
+#   weights   evaluation weights from evaluation.py (default: engine.evaluate)
+#   source    an engine.py file to use instead of this one, e.g. from a
+#             checkout of the previous build
+#   book      an opening book from openingBook.py (default: none)
+#
+# Each finished game is appended to the checkpoint file, and games already
+# in it are not played again, so a stopped tournament carries on where it
+# stopped. A game is only taken from the checkpoint if it was played by the
+# same engines (settings and file contents) from the same opening. With --sprt a two engine match stops as soon as the sequential
+# probability ratio test decides whether the first engine is elo1 stronger
+# or no more than elo0 stronger.
+#
+#   python3 tournament.py new:depth=8,weights=weights.json old:depth=8 --games 2000 --sprt 0 10
+#   python3 tournament.py a:time=0.1 b:time=0.2 c:depth=6 --mode round-robin
+#
+
+import os
+import json
+import hashlib
+import math
+import time
+import random
+import argparse
+import importlib.util
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from rules import *
+from players import playGame
+
+EngineConfig = namedtuple("EngineConfig", ["name", "maxDepth", "timeLimit", "weights", "source", "book"])
+
+# Result text for each winner, from white's point of view
+RESULT_TEXT = {Player.ONE: "1-0", Player.TWO: "0-1", None: "1/2-1/2"}
+WHITE_SCORES = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}
+
+# Parse name:key=value,... into an EngineConfig
+def parseEngine(text):
+    name, _, options = text.partition(":")
+    values = {"depth": "64", "time": "0.1", "weights": None, "source": None, "book": None}
+    for option in filter(None, options.split(",")):
+        key, _, value = option.partition("=")
+        if key not in values:
+            raise argparse.ArgumentTypeError("unknown engine option %r in %r" % (key, text))
+        values[key] = value
+    return EngineConfig(name, int(values["depth"]), float(values["time"]), values["weights"], values["source"], values["book"])
+
+#
+# Openings
+#
+
+# Positions a few plies after CheckersBoard's start position that a shallow
+# search thinks are close to level. Returns a list of move paths for each.
+def getOpenings(plies=3, depth=6, margin=30, count=None, seed=0):
+    from engine import Engine
+    lines = {}
+    def extend(position, path):
+        if len(path) == plies:
+            lines.setdefault(position, path)
+            return
+        for move in legalMoves(position):
+            extend(applyMove(position, move), path + [move.path])
+    extend(startingPosition(), [])
+
+    engine = Engine(timeLimit=1e9, maxDepth=depth, tableSize=8)
+    openings = []
+    for position, path in lines.items():
+        # The engine doesn't search a forced move, so play them out and judge
+        # the first position with a choice. Openings that lose outright are left out.
+        moves = legalMoves(position)
+        while len(moves) == 1:
+            position = applyMove(position, moves[0])
+            moves = legalMoves(position)
+        if not moves: continue
+        engine.search(position)
+        if abs(engine.score) <= margin:
+            openings.append(path)
+    openings.sort()
+    random.Random(seed).shuffle(openings)
+    return openings[:count]
+
+#
+# Games
+#
+
+# Engines already built in this process, by configuration
+engines = {}
+
+def getEngine(config):
+    engine = engines.get(config)
+    if engine is None:
+        if config.source is None:
+            import engine as module
+        else:
+            spec = importlib.util.spec_from_file_location("engine_%s" % config.name, config.source)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        options = {}
+        if config.weights is not None:
+            from evaluation import makeEvaluate, loadWeights
+            options["evaluator"] = makeEvaluate(loadWeights(config.weights))
+        if config.book is not None:
+            from openingBook import OpeningBook
+            options["book"] = OpeningBook(config.book)
+        engine = module.Engine(config.timeLimit, config.maxDepth, 16, **options)
+        engines[config] = engine
+    return engine
+
+# Plays the move an engine finds, like players.EnginePlayer
+class TournamentPlayer(object):
+    def __init__(self, config):
+        self.engine = getEngine(config)
+        self.engine.table.clear()
+
+    def getMove(self, position, moves):
+        if len(moves) == 1:
+            return moves[0]
+        return self.engine.search(position)
+
+# Play one game in a worker process. Returns its checkpoint record.
+def playTournamentGame(gameNumber, white, yellow, openingNumber, opening, maxPlies):
+    position = startingPosition()
+    for path in opening:
+        position = applyMove(position, [move for move in legalMoves(position) if move.path == tuple(path)][0])
+    startTime = time.time()
+    winner, moves = playGame(TournamentPlayer(white), TournamentPlayer(yellow), maxPlies - len(opening), position)
+    return {"game": gameNumber, "white": white.name, "yellow": yellow.name, "opening": openingNumber,
+            "result": RESULT_TEXT[winner], "plies": len(opening) + len(moves), "seconds": round(time.time() - startTime, 3)}
+
+# The (game number, white, yellow, opening number) of every game to play.
+# Each pairing plays each opening once with each colour, over and over until
+# there are games games per pairing.
+def getSchedule(configs, mode, games, numOpenings):
+    if mode == "gauntlet":
+        pairings = [(configs[0], opponent) for opponent in configs[1:]]
+    else:
+        pairings = [(configs[first], configs[second]) for first in range(len(configs)) for second in range(first + 1, len(configs))]
+    schedule = []
+    for index in range(games):
+        openingNumber = (index // 2) % numOpenings
+        for first, second in pairings:
+            white, yellow = (first, second) if index % 2 == 0 else (second, first)
+            schedule.append((len(schedule), white, yellow, openingNumber))
+    return schedule
+
+#
+# Statistics
+#
+
+# Expected score of a side that is elo stronger
+def getExpectedScore(elo):
+    return 1.0 / (1.0 + 10.0 ** (-elo / 400.0))
+
+def getElo(score):
+    score = min(max(score, 1e-6), 1.0 - 1e-6)
+    return -400.0 * math.log10(1.0 / score - 1.0)
+
+#
+# MatchStats Class
+#
+# The wins, losses and draws of one engine against another.
+#
+class MatchStats(object):
+    def __init__(self, first, second):
+        self.first = first
+        self.second = second
+        self.wins = 0
+        self.losses = 0
+        self.draws = 0
+
+    def add(self, record):
+        score = WHITE_SCORES[record["result"]]
+        if record["yellow"] == self.first:
+            score = 1.0 - score
+        if score == 1.0:
+            self.wins += 1
+        elif score == 0.0:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+    def getGames(self):
+        return self.wins + self.losses + self.draws
+
+    # The first engine's mean score and the variance of one game's score
+    def getScore(self):
+        games = max(self.getGames(), 1)
+        score = (self.wins + 0.5 * self.draws) / games
+        variance = (self.wins * (1.0 - score) ** 2 + self.losses * score ** 2 + self.draws * (0.5 - score) ** 2) / games
+        return (score, variance)
+
+    # The first engine's Elo advantage and its 95% confidence interval
+    def getElo(self):
+        score, variance = self.getScore()
+        error = 1.96 * math.sqrt(variance / max(self.getGames(), 1))
+        return (getElo(score), getElo(score - error), getElo(score + error))
+
+    # Log likelihood ratio of the first engine being elo1 rather than elo0 stronger
+    # (the normal approximation used by generalized SPRT)
+    def getLogLikelihoodRatio(self, elo0, elo1):
+        score, variance = self.getScore()
+        if variance <= 0.0: return 0.0
+        score0 = getExpectedScore(elo0)
+        score1 = getExpectedScore(elo1)
+        return self.getGames() * (score1 - score0) * (2.0 * score - score0 - score1) / (2.0 * variance)
+
+    def describe(self):
+        elo, low, high = self.getElo()
+        return "%s vs %s: +%d -%d =%d  Elo %+.1f [%+.1f, %+.1f]" % (self.first, self.second, self.wins, self.losses, self.draws, elo, low, high)
+
+# The SPRT decision: "H1" (elo1 is more likely), "H0" or None to keep playing
+def getSprtResult(stats, elo0, elo1, alpha=0.05, beta=0.05):
+    llr = stats.getLogLikelihoodRatio(elo0, elo1)
+    if llr >= math.log((1.0 - beta) / alpha):
+        return "H1"
+    if llr <= math.log(beta / (1.0 - alpha)):
+        return "H0"
+    return None
+
+#
+# Tournament
+#
+
+# What a checkpoint record keeps about an engine: its settings and a hash of
+# the engine, weights and book files it plays with
+def getEngineRecord(config):
+    record = config._asdict()
+    digest = hashlib.sha1()
+    for path in (config.source or os.path.join(os.path.dirname(os.path.abspath(__file__)), "engine.py"), config.weights, config.book):
+        if path is not None:
+            with open(path, "rb") as data:
+                digest.update(data.read())
+    record["files"] = digest.hexdigest()
+    return record
+
+def readCheckpoint(path):
+    records = {}
+    if path is not None and os.path.exists(path):
+        with open(path) as lines:
+            for line in lines:
+                if line.strip():
+                    record = json.loads(line)
+                    records[record["game"]] = record
+    return records
+
+def runTournament(configs, mode="gauntlet", games=100, openings=None, maxPlies=200, workers=None,
+                  checkpoint=None, sprt=None, alpha=0.05, beta=0.05, log=print):
+    openings = openings or [[]]
+    schedule = getSchedule(configs, mode, games, len(openings))
+    names = [config.name for config in configs]
+    def getMatch(white, yellow):
+        key = tuple(sorted((white, yellow), key=names.index))
+        if key not in matches:
+            matches[key] = MatchStats(*key)
+        return matches[key]
+    matches = {}
+    for number, white, yellow, openingNumber in schedule:
+        getMatch(white.name, yellow.name)
+
+    # What identifies a game in the checkpoint, besides its number
+    engineRecords = dict((config, getEngineRecord(config)) for config in configs)
+    def getGameRecord(white, yellow, openingNumber):
+        return {"whiteEngine": engineRecords[white], "yellowEngine": engineRecords[yellow],
+                "openingMoves": [list(path) for path in openings[openingNumber]], "maxPlies": maxPlies}
+    gameRecords = dict((number, getGameRecord(white, yellow, openingNumber)) for number, white, yellow, openingNumber in schedule)
+
+    # Pick up the games already played by the same engines from the same openings
+    done = readCheckpoint(checkpoint)
+    stale = 0
+    for number, white, yellow, openingNumber in schedule:
+        record = done.get(number)
+        if record is not None and all(record.get(key) == value for key, value in gameRecords[number].items()):
+            getMatch(white.name, yellow.name).add(record)
+        elif done.pop(number, None) is not None:
+            stale += 1
+    remaining = [game for game in schedule if game[0] not in done]
+    log("%d games, %d already played, %d openings" % (len(schedule), len(done), len(openings)))
+    if stale:
+        log("%d games in %s were played with other engines or openings and will be played again" % (stale, checkpoint))
+
+    def getDecision():
+        if sprt is None: return None
+        return getSprtResult(next(iter(matches.values())), sprt[0], sprt[1], alpha, beta)
+
+    decision = getDecision()
+    startTime = time.time()
+    played = 0
+    output = open(checkpoint, "a") if checkpoint is not None else None
+    pool = ProcessPoolExecutor(max_workers=max(1, workers or os.cpu_count() or 1))
+    try:
+        tasks = [] if decision else [pool.submit(playTournamentGame, number, white, yellow, openingNumber, openings[openingNumber], maxPlies)
+                                     for number, white, yellow, openingNumber in remaining]
+        for task in as_completed(tasks):
+            record = task.result()
+            record.update(gameRecords[record["game"]])
+            if output is not None:
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+            getMatch(record["white"], record["yellow"]).add(record)
+            played += 1
+            if played % 50 == 0:
+                elapsed = time.time() - startTime
+                log("%d/%d games (%.2f games/sec)" % (len(done) + played, len(schedule), played / elapsed))
+                for stats in matches.values():
+                    log("  " + stats.describe())
+            decision = getDecision()
+            if decision is not None:
+                break
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        if output is not None:
+            output.close()
+
+    elapsed = max(time.time() - startTime, 1e-9)
+    log("played %d games in %.1fs (%.2f games/sec)" % (played, elapsed, played / elapsed))
+    for stats in matches.values():
+        log(stats.describe())
+    if sprt is not None:
+        stats = next(iter(matches.values()))
+        log("SPRT elo0 %g elo1 %g: LLR %.2f [%.2f, %.2f] %s" %
+            (sprt[0], sprt[1], stats.getLogLikelihoodRatio(*sprt), math.log(beta / (1.0 - alpha)), math.log((1.0 - beta) / alpha),
+             {"H1": "accept H1 (elo1)", "H0": "accept H0 (elo0)", None: "undecided"}[decision]))
+    return (matches, decision)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play engine configurations against each other and estimate the Elo difference.")
+    parser.add_argument("engines", type=parseEngine, nargs="+", help="engines as name:depth=8,time=0.1,weights=FILE,source=FILE,book=FILE")
+    parser.add_argument("--mode", choices=["gauntlet", "round-robin"], default="gauntlet",
+                        help="gauntlet: the first engine plays each of the others; round-robin: every pair plays (default: gauntlet)")
+    parser.add_argument("--games", type=int, default=100, help="games per pairing (default: 100)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes (default: one per core)")
+    parser.add_argument("--checkpoint", default="tournament.jsonl", help="file results are appended to and resumed from (default: tournament.jsonl)")
+    parser.add_argument("--opening-plies", type=int, default=3, help="plies in each opening (default: 3)")
+    parser.add_argument("--opening-depth", type=int, default=6, help="depth of the search that checks openings are level (default: 6)")
+    parser.add_argument("--opening-margin", type=int, default=30, help="largest score an opening may have (default: 30)")
+    parser.add_argument("--max-plies", type=int, default=200, help="plies before a game is called a draw (default: 200)")
+    parser.add_argument("--sprt", type=float, nargs=2, metavar=("ELO0", "ELO1"), help="stop when SPRT decides between ELO0 and ELO1")
+    parser.add_argument("--alpha", type=float, default=0.05, help="SPRT false positive rate (default: 0.05)")
+    parser.add_argument("--beta", type=float, default=0.05, help="SPRT false negative rate (default: 0.05)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the order of the openings (default: 0)")
+    args = parser.parse_args(argv)
+
+    if len(args.engines) < 2:
+        parser.error("need at least two engines")
+    if len(set(config.name for config in args.engines)) != len(args.engines):
+        parser.error("engine names must be different")
+    if args.sprt is not None and len(args.engines) != 2:
+        parser.error("--sprt needs exactly two engines")
+
+    startTime = time.time()
+    openings = getOpenings(args.opening_plies, args.opening_depth, args.opening_margin, seed=args.seed)
+    print("%d level openings in %.1fs" % (len(openings), time.time() - startTime))
+    runTournament(args.engines, args.mode, args.games, openings, args.max_plies, args.workers,
+                  args.checkpoint, args.sprt, args.alpha, args.beta)
+
+if __name__ == "__main__":
+    main()